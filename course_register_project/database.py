@@ -1,3 +1,4 @@
+from itertools import islice
 from os import environ as env
 
 import data
@@ -5,6 +6,8 @@ import mysql.connector
 import typer
 from dotenv import load_dotenv
 from mysql.connector import Error, connect
+from mysql.connector.constants import ClientFlag
+from mysql.connector.pooling import MySQLConnectionPool
 
 # Load environment variables
 load_dotenv()
@@ -22,9 +25,11 @@ Modules Required:
     - data: Custom module providing initial data for database population.
 
 Functions:
-    - get_connection(): Establishes a connection to the MySQL database using environment variables.
+    - get_pool(): Returns the shared connection pool, creating it on first use.
+    - close_pool(): Closes the pooled connections; the next call opens a new pool.
+    - get_connection(): Borrows a connection from the pool (closing it hands it back).
     - reset(): Resets the database structure by executing DDL statements from a file.
-    - query(connection, q, data=None, many=False, fetch=None): Executes SQL queries on the given connection.
+    - query(connection, q, data=None, many=False, fetch=None, cursor=None): Executes SQL queries on the given connection.
     - initialize_data(): Populates the database with initial data like students, courses, and prerequisites.
     - add_a_student(first_name, last_name, unix_id): Adds a new student to the database.
     - add_a_new_course(moniker, name, department): Adds a new course to the database.
@@ -39,6 +44,13 @@ Functions:
     - get_transcript_for(student): Returns a transcript for a student, including grades and letter grades.
     - get_courses_with_most_enrolled_students(n): Returns the courses with the most enrolled students.
     - get_top_performing_students(n): Returns the top-performing students based on average grades.
+    - import_rows(q, rows, batch_size=1000, on_batch=None): Bulk-runs a statement over a stream of rows.
+
+Connections:
+    Every function borrows a connection from one pool of MYSQL_POOL_SIZE (default 5)
+    connections, opened on the first call, so scripts issuing thousands of calls do not
+    pay a handshake per call. A borrowed connection is pinged and reconnected if it went
+    stale (e.g. after wait_timeout). MYSQL_POOL_SIZE=0 opens a new connection per call.
 
 Usage:
     1. Ensure that the environment variables are properly set for database connection.
@@ -50,19 +62,65 @@ Note:
     - Customize SQL queries and database structure as required for your use case.
 """
 
+_pool = None
+
+
+def connection_params():
+    """Connection settings from the environment."""
+    return {
+        "database": env.get("MYSQL_DATABASE"),
+        "host": env.get("MYSQL_HOST"),
+        "password": env.get("MYSQL_PASSWORD"),
+        "port": env.get("MYSQL_PORT"),
+        "user": env.get("MYSQL_USER"),
+        # rowcount counts matched rather than changed rows, so import_rows() can tell a
+        # grade for a missing enrollment from a grade that was already set
+        "client_flags": [ClientFlag.FOUND_ROWS],
+    }
+
+
+def get_pool():
+    """Returns the shared connection pool, creating it on first use so importing this module never connects."""
+    global _pool
+
+    if _pool is None:
+        # the pool opens all of its connections up front, and mysql.connector allows at most 32
+        _pool = MySQLConnectionPool(pool_name="registrar", pool_size=int(env.get("MYSQL_POOL_SIZE", 5)),
+                                    **connection_params())
+        if env.get("MYSQL_VERBOSE") == "YES":
+            print(f"Connected to MySQL successfully ({_pool.pool_size} pooled connections)")
+
+    return _pool
+
+
+def close_pool():
+    """Closes the pooled connections; the next get_connection() opens a new pool."""
+    global _pool
+
+    if _pool is not None:
+        # mysql.connector has no public way to close a pool
+        _pool._remove_connections()
+        _pool = None
+
+
 def get_connection():
-    """Establishes a connection to the MySQL database using environment variables."""
+    """
+    Borrows a connection from the pool; closing it (or leaving its `with` block) hands it back.
+
+    The pool pings the connection before handing it out and reconnects it if the server
+    dropped it; failing that, the connection is retried once on a fresh pool.
+    """
     connection = None
     try:
-        connection = connect(
-            database=env.get("MYSQL_DATABASE"),
-            host=env.get("MYSQL_HOST"),
-            password=env.get("MYSQL_PASSWORD"),
-            port=env.get("MYSQL_PORT"),
-            user=env.get("MYSQL_USER"),
-        )
-        if env.get("MYSQL_VERBOSE") == "YES":
-            print("Connected to MySQL successfully")
+        if not int(env.get("MYSQL_POOL_SIZE", 5)):
+            connection = connect(**connection_params())
+        else:
+            try:
+                connection = get_pool().get_connection()
+            except mysql.connector.InterfaceError:
+                # every reconnect failed, e.g. the server restarted: start over with new connections
+                close_pool()
+                connection = get_pool().get_connection()
     except Error as e:
         print(f"Error '{e}' occurred while attempting to connect to the database.")
 
@@ -78,8 +136,11 @@ def reset():
                     if env.get("MYSQL_VERBOSE") == "YES":
                         print("Executed:", result.statement)
 
+    # the DDL drops and recreates the database, which leaves the other pooled sessions without one
+    close_pool()
+
 
-def query(connection, q, data=None, many=False, fetch=None):
+def query(connection, q, data=None, many=False, fetch=None, cursor=None):
     """
     Executes a query on the given MySQL connection.
 
@@ -89,6 +150,7 @@ def query(connection, q, data=None, many=False, fetch=None):
         data (optional): Data to be used in the query, if required.
         many (bool): Indicates if the query involves multiple rows of data.
         fetch (bool): If True, fetches the result after executing the query.
+        cursor (optional): A cursor to reuse across several queries; it is left open.
 
     Returns:
         If fetch is True, returns the fetched result from the query. Otherwise, commits the changes.
@@ -96,7 +158,9 @@ def query(connection, q, data=None, many=False, fetch=None):
     Raises:
         mysql.connector.IntegrityError, mysql.connector.DatabaseError: If there's an error in the query execution.
     """
-    cursor = connection.cursor()
+    own_cursor = cursor is None
+    if own_cursor:
+        cursor = connection.cursor()
 
     try:
         if many:
@@ -116,16 +180,23 @@ def query(connection, q, data=None, many=False, fetch=None):
     except (mysql.connector.IntegrityError, mysql.connector.DatabaseError) as e:
         typer.echo(f"Statement execution failed: {typer.style(e, bg=typer.colors.RED, fg=typer.colors.BLACK)}")
     finally:
-        cursor.close()
+        if own_cursor:
+            cursor.close()
 
 
 def initialize_data():
     """Populates the database with initial data like students, courses, prerequisites, and letter grades."""
-    with get_connection() as conn:
-        query(conn, "INSERT INTO students (first_name, last_name, unix_id) VALUES (%s, %s, %s);", data.students, many=True)
-        query(conn, "INSERT INTO courses (moniker, name, department) VALUES (%s, %s, %s);", data.courses, many=True)
-        query(conn, "INSERT INTO prerequisites (course, prereq, min_grade) VALUES (%s, %s, %s);", data.prerequisites, many=True)
-        query(conn, "INSERT INTO letter_grade (grade, letter) VALUES (%s, %s);", data.letter_grades, many=True)
+    inserts = [
+        ("INSERT INTO students (first_name, last_name, unix_id) VALUES (%s, %s, %s);", data.students),
+        ("INSERT INTO courses (moniker, name, department) VALUES (%s, %s, %s);", data.courses),
+        ("INSERT INTO prerequisites (course, prereq, min_grade) VALUES (%s, %s, %s);", data.prerequisites),
+        ("INSERT INTO letter_grade (grade, letter) VALUES (%s, %s);", data.letter_grades),
+    ]
+
+    # one connection and one cursor for all four tables
+    with get_connection() as conn, conn.cursor() as cursor:
+        for q, rows in inserts:
+            query(conn, q, rows, many=True, cursor=cursor)
 
 
 def add_a_student(first_name, last_name, unix_id):
@@ -364,3 +435,81 @@ def get_top_performing_students(n):
         data = (n,)
 
         return query(conn, q, data, fetch=True)
+
+
+# statement and its parameters in order, per bulk import; the names are the CSV columns registrar.py expects
+IMPORTS = {
+    "students": ("INSERT INTO students (first_name, last_name, unix_id) VALUES (%s, %s, %s)",
+                 ["first_name", "last_name", "unix_id"]),
+    "courses": ("INSERT INTO courses (moniker, name, department) VALUES (%s, %s, %s)",
+                ["moniker", "name", "department"]),
+    "enrollments": ("INSERT INTO student_course (student, course, year) VALUES (%s, %s, %s)",
+                    ["student", "course", "year"]),
+    "grades": ("UPDATE student_course SET grade = %s WHERE student = %s AND course = %s AND year = %s",
+               ["grade", "student", "course", "year"]),
+}
+
+
+def _import_one_by_one(conn, cursor, q, batch, failures):
+    """Replays a failed batch row by row; MySQL undoes just the failing statement, so the others stay."""
+    imported = 0
+
+    for line, values in batch:
+        try:
+            cursor.execute(q, values)
+        except (mysql.connector.IntegrityError, mysql.connector.DatabaseError) as e:
+            failures.append((line, values, e.msg))
+            continue
+
+        if cursor.rowcount < 1:
+            failures.append((line, values, "No matching row"))
+        else:
+            imported += 1
+
+    conn.commit()
+    return imported
+
+
+def import_rows(q, rows, batch_size=1000, on_batch=None):
+    """
+    Runs one INSERT or UPDATE for every row of a stream, batch by batch.
+
+    Each batch goes through a single executemany() (one multi-row statement for INSERTs) and is
+    committed as one transaction. A batch that fails, e.g. because the prerequisite trigger rejected
+    an enrollment, or that leaves rows unmatched is rolled back and replayed row by row, so only
+    the offending rows are skipped and the import carries on.
+
+    Args:
+        q (str): The statement, with one %s per value.
+        rows (iterable): (line_number, values) pairs; read lazily, so it can stream from a file.
+        batch_size (int): Rows per executemany() call and per transaction.
+        on_batch (callable, optional): Called with (rows_done, rows_imported) after every batch.
+
+    Returns:
+        A tuple (imported, failures): how many rows took effect, and (line_number, values, error)
+        for each row that did not.
+    """
+    rows = iter(rows)
+    done = imported = 0
+    failures = []
+
+    with get_connection() as conn, conn.cursor() as cursor:
+        while batch := list(islice(rows, batch_size)):
+            try:
+                cursor.executemany(q, [values for _, values in batch])
+                complete = cursor.rowcount >= len(batch)
+            except (mysql.connector.IntegrityError, mysql.connector.DatabaseError):
+                complete = False
+
+            if complete:
+                conn.commit()
+                imported += len(batch)
+            else:
+                conn.rollback()
+                imported += _import_one_by_one(conn, cursor, q, batch, failures)
+
+            done += len(batch)
+            if on_batch:
+                on_batch(done, imported)
+
+    return imported, failures
@@ -1,15 +1,21 @@
+import csv
 from datetime import datetime
 from os import environ as env
+from pathlib import Path
+from time import perf_counter
 
 import typer
-from database import (add_a_new_course, add_a_prerequisite, add_a_student,
-                      enroll_student, get_courses_with_most_enrolled_students,
+from database import (IMPORTS, add_a_new_course, add_a_prerequisite,
+                      add_a_student, enroll_student,
+                      get_courses_with_most_enrolled_students,
                       get_top_performing_students, get_transcript_for,
-                      initialize_data, reset, set_grade,
+                      import_rows, initialize_data, reset, set_grade,
                       show_courses_a_student_is_currently_taking,
                       show_courses_by, show_prerequisites_for, show_student_by,
                       unenroll_student)
 from rich.console import Console
+from rich.progress import (BarColumn, Progress, TaskProgressColumn,
+                           TextColumn, TimeElapsedColumn)
 from rich.table import Table
 
 # Create a Typer application for command-line interactions
@@ -35,6 +41,8 @@ Commands:
     - transcript(student): Displays the transcript for a specific student.
     - most_enrolled(n): Shows the courses with the most enrolled students.
     - top_students(n): Shows the top-performing students based on average grades.
+    - import_students(path), import_courses(path), import_enrollments(path), import_grades(path):
+      Bulk-load a CSV file with a header row, in batches, reporting the rows that were rejected.
 
 Usage:
     - Use the `typer` module to run the CLI with the defined commands.
@@ -299,5 +307,156 @@ def top_students(n: int = 10):
     )
 
 
+# CSV columns parsed as integers; an enrollment or grade without a year is for the current year
+INTEGER_COLUMNS = {"year", "grade"}
+
+
+def read_csv(path, columns, progress, task, failures):
+    """
+    Streams (line_number, values) from a CSV file, in the order of `columns`.
+
+    Rows that cannot be parsed, or are not valid UTF-8, are added to `failures` instead. The
+    progress bar advances by the bytes read, so it is accurate without counting the rows first.
+    """
+    with open(path, "rb") as f:
+        # bad bytes become U+FFFD here and reject their row below, instead of ending the import
+        lines = (progress.advance(task, len(line)) or line.decode("utf-8-sig", errors="replace") for line in f)
+        reader = csv.DictReader(lines)
+
+        missing = [c for c in columns if c not in (reader.fieldnames or []) and c != "year"]
+        if missing:
+            raise typer.BadParameter(f"{path} has no {', '.join(missing)} column(s)")
+
+        for row in reader:
+            line = reader.line_num
+            try:
+                if any("\ufffd" in (value or "") for value in row.values() if isinstance(value, str)):
+                    raise ValueError("not valid UTF-8")
+
+                values = []
+                for column in columns:
+                    value = (row.get(column) or "").strip()
+                    if column == "year" and not value:
+                        value = datetime.now().year
+                    elif not value:
+                        raise ValueError(f"{column} is empty")
+                    values.append(int(value) if column in INTEGER_COLUMNS else value)
+            except ValueError as e:
+                failures.append((line, list(row.values()), str(e)))
+                continue
+
+            yield line, tuple(values)
+
+
+def import_csv(kind, path, batch_size):
+    """
+    Loads a CSV file through database.import_rows() with a progress bar, then reports the rejected rows.
+
+    Args:
+        kind (str): One of database.IMPORTS.
+        path (Path): The CSV file; its header names the columns.
+        batch_size (int): Rows per batch and transaction.
+    """
+    q, columns = IMPORTS[kind]
+    failures = []
+    started = perf_counter()
+
+    progress = Progress(
+        TextColumn("[bold]{task.description}"),
+        BarColumn(),
+        TaskProgressColumn(),
+        TextColumn("{task.fields[rows]:,} rows"),
+        TextColumn("{task.fields[rate]:,.0f} rows/s"),
+        TimeElapsedColumn(),
+        console=console,
+    )
+
+    with progress:
+        task = progress.add_task(f"Importing {kind}", total=path.stat().st_size, rows=0, rate=0)
+
+        def on_batch(done, imported):
+            # rows that failed to parse never reach a batch but were read all the same
+            read = done + len(failures)
+            progress.update(task, rows=read, rate=read / (perf_counter() - started))
+
+        imported, rejected = import_rows(q, read_csv(path, columns, progress, task, failures), batch_size, on_batch)
+
+    failures = sorted(failures + rejected, key=lambda failure: failure[0])
+    elapsed = perf_counter() - started
+    console.print(f"Imported {imported:,} {kind} in {elapsed:.1f}s ({imported / elapsed:,.0f} rows/s), "
+                  f"{len(failures):,} rejected.", style="bold")
+
+    if failures:
+        shown = failures[:50]
+        pretty_table(["Line", "Row", "Error"], [(line, ", ".join(map(str, values)), error)
+                                                for line, values, error in shown], in_color="red")
+        if len(failures) > len(shown):
+            console.print(f"...and {len(failures) - len(shown):,} more.")
+
+
+@app.command()
+def import_students(path: Path = typer.Argument(..., exists=True, dir_okay=False), batch_size: int = 1000):
+    """
+    Adds the students listed in a CSV file with the columns first_name, last_name, unix_id.
+
+    Args:
+        path (Path): The CSV file, with a header row.
+        batch_size (int): Rows per batch and transaction (default is 1000).
+
+    Usage:
+        `python script.py import-students <path> [--batch-size n]`
+    """
+    import_csv("students", path, batch_size)
+
+
+@app.command()
+def import_courses(path: Path = typer.Argument(..., exists=True, dir_okay=False), batch_size: int = 1000):
+    """
+    Adds the courses listed in a CSV file with the columns moniker, name, department.
+
+    Args:
+        path (Path): The CSV file, with a header row.
+        batch_size (int): Rows per batch and transaction (default is 1000).
+
+    Usage:
+        `python script.py import-courses <path> [--batch-size n]`
+    """
+    import_csv("courses", path, batch_size)
+
+
+@app.command()
+def import_enrollments(path: Path = typer.Argument(..., exists=True, dir_okay=False), batch_size: int = 1000):
+    """
+    Enrolls students as listed in a CSV file with the columns student, course and optionally year.
+
+    Enrollments the prerequisite check rejects are reported and skipped; the rest are kept.
+
+    Args:
+        path (Path): The CSV file, with a header row.
+        batch_size (int): Rows per batch and transaction (default is 1000).
+
+    Usage:
+        `python script.py import-enrollments <path> [--batch-size n]`
+    """
+    import_csv("enrollments", path, batch_size)
+
+
+@app.command()
+def import_grades(path: Path = typer.Argument(..., exists=True, dir_okay=False), batch_size: int = 1000):
+    """
+    Sets grades as listed in a CSV file with the columns student, course, grade and optionally year.
+
+    Grades for enrollments that do not exist are reported and skipped.
+
+    Args:
+        path (Path): The CSV file, with a header row.
+        batch_size (int): Rows per batch and transaction (default is 1000).
+
+    Usage:
+        `python script.py import-grades <path> [--batch-size n]`
+    """
+    import_csv("grades", path, batch_size)
+
+
 if __name__ == "__main__":
     app()
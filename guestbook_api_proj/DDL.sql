@@ -13,9 +13,16 @@ create table if not exists tokens
     id         serial PRIMARY KEY,
     token      text      NOT NULL,
     user_id    integer   NOT NULL REFERENCES users (id) ON DELETE CASCADE,
-    created_at timestamp NOT NULL DEFAULT current_timestamp
+    created_at timestamp NOT NULL DEFAULT current_timestamp,
+    -- set by /register from TOKEN_TTL; expired tokens are purged in the background
+    expires_at timestamptz NOT NULL DEFAULT current_timestamp + interval '2 days'
 );
 
+-- POST /activate
+create index if not exists tokens_token_idx on tokens (token);
+create index if not exists tokens_expires_at_idx on tokens (expires_at);
+create index if not exists tokens_user_id_idx on tokens (user_id);
+
 create table if not exists guestbook
 (
     id         serial PRIMARY KEY,
@@ -23,23 +30,166 @@ create table if not exists guestbook
     user_id    integer   NOT NULL REFERENCES users (id) ON DELETE CASCADE,
     private    boolean   NOT NULL DEFAULT false,
     created_at timestamp NOT NULL DEFAULT current_timestamp,
-    updated_at  timestamp
+    updated_at  timestamp,
+    -- maintained by postgres on every insert/update of message
+    search     tsvector GENERATED ALWAYS AS (to_tsvector('english', message)) STORED,
+    -- kept in step with upvotes by the upvotes_count_insert and upvotes_count_delete triggers
+    upvote_count integer NOT NULL DEFAULT 0
 );
 
+create index if not exists guestbook_search_idx on guestbook using gin (search);
+-- GET /messages/most_upvoted
+create index if not exists guestbook_top_upvoted_idx on guestbook (private, upvote_count desc, id desc);
+
+-- keyset pagination over (created_at, id), see GET /messages
+create index if not exists guestbook_created_at_id_idx on guestbook (created_at, id);
+
+-- the caller's own private messages (or_where private and user_id)
+create index if not exists guestbook_user_id_private_idx on guestbook (user_id, private);
+
 create table if not exists upvotes
 (
     id         serial PRIMARY KEY,
     user_id    integer   NOT NULL REFERENCES users (id) ON DELETE CASCADE,
     message_id integer   NOT NULL REFERENCES guestbook (id) ON DELETE CASCADE,
-    created_at timestamp NOT NULL DEFAULT current_timestamp
+    created_at timestamp NOT NULL DEFAULT current_timestamp,
+    CONSTRAINT upvotes_user_message_key UNIQUE (user_id, message_id)
 );
 
-create or replace view top_messages as
-select g.id, g.message, count(u.id) as upvotes
-from guestbook as g
-         left join upvotes u on g.id = u.message_id
-where private = false
-group by g.id
-order by upvotes desc
-limit 10;
+create index if not exists upvotes_message_id_idx on upvotes (message_id);
+
+create or replace function guestbook_count_upvote() returns trigger
+    language plpgsql as
+$$
+begin
+    if tg_op = 'INSERT' then
+        update guestbook as g
+        set upvote_count = g.upvote_count + c.n
+        from (select message_id, count(*)::integer as n from inserted group by message_id) as c
+        where g.id = c.message_id;
+    else
+        -- also fires for upvotes cascading from a deleted message, where this matches nothing
+        update guestbook as g
+        set upvote_count = g.upvote_count - c.n
+        from (select message_id, count(*)::integer as n from deleted group by message_id) as c
+        where g.id = c.message_id;
+    end if;
+
+    return null;
+end
+$$;
+
+-- transition tables need one trigger per event
+drop trigger if exists upvotes_count_insert on upvotes;
+create trigger upvotes_count_insert
+    after insert
+    on upvotes
+    referencing new table as inserted
+    for each statement
+execute function guestbook_count_upvote();
+
+drop trigger if exists upvotes_count_delete on upvotes;
+create trigger upvotes_count_delete
+    after delete
+    on upvotes
+    referencing old table as deleted
+    for each statement
+execute function guestbook_count_upvote();
+
+-- recomputes every counter from upvotes, returns how many were wrong
+create or replace function repair_upvote_counts() returns integer
+    language plpgsql as
+$$
+declare
+    fixed integer;
+begin
+    -- block new upvotes until the recount commits so none is lost in between
+    lock table upvotes in share mode;
+
+    with actual as (select g.id, count(u.id)::integer as n
+                    from guestbook as g
+                             left join upvotes u on g.id = u.message_id
+                    group by g.id)
+    update guestbook as g
+    set upvote_count = a.n
+    from actual as a
+    where g.id = a.id
+      and g.upvote_count <> a.n;
+
+    get diagnostics fixed = row_count;
+    return fixed;
+end
+$$;
+
+-- deletes at most batch_size expired tokens and returns how many it removed.
+-- skip locked lets several app instances purge side by side without waiting on each other
+create or replace function purge_expired_tokens(batch_size integer) returns integer
+    language plpgsql as
+$$
+declare
+    purged integer;
+begin
+    delete
+    from tokens
+    where id in (select id
+                 from tokens
+                 where expires_at < current_timestamp
+                 limit batch_size for update skip locked);
+
+    get diagnostics purged = row_count;
+    return purged;
+end
+$$;
+
+-- the whole POST /messages/{id}/upvote decision in one round trip.
+-- returns 'upvoted', 'not_found' (missing, or someone else's private message),
+-- 'own_message' or 'duplicate'
+create or replace function upvote_message(voter integer, target integer) returns text
+    language plpgsql as
+$$
+declare
+    author     integer;
+    is_private boolean;
+begin
+    -- key share keeps the message from being deleted under us without blocking the counter update
+    select user_id, private into author, is_private from guestbook where id = target for key share;
+
+    if not found or (is_private and author <> voter) then
+        return 'not_found';
+    end if;
+
+    if author = voter then
+        return 'own_message';
+    end if;
+
+    insert into upvotes (user_id, message_id) values (voter, target) on conflict (user_id, message_id) do nothing;
+
+    if not found then
+        return 'duplicate';
+    end if;
+
+    return 'upvoted';
+end
+$$;
+
+-- flush of the write-behind upvote buffer: inserts (voters[i], targets[i]) pairs in one statement,
+-- skipping duplicates, the voter's own messages and messages deleted or made private since they
+-- were accepted. returns how many were inserted
+create or replace function add_upvotes(voters integer[], targets integer[]) returns integer
+    language plpgsql as
+$$
+declare
+    added integer;
+begin
+    insert into upvotes (user_id, message_id)
+    select v.voter, v.target
+    from unnest(voters, targets) as v(voter, target)
+             join guestbook as g on g.id = v.target
+    where g.user_id <> v.voter
+      and not g.private
+    on conflict (user_id, message_id) do nothing;
 
+    get diagnostics added = row_count;
+    return added;
+end
+$$;
@@ -0,0 +1,441 @@
+from contextlib import asynccontextmanager
+from os import environ as env
+from time import perf_counter
+from uuid import uuid4
+from psycopg import AsyncConnection, Error as DatabaseError, OperationalError
+from psycopg.pq import TransactionStatus
+from psycopg.rows import dict_row, tuple_row
+from psycopg_pool import AsyncConnectionPool
+from query import QueryBuilder
+from replicas import ReplicaRouter, replica_urls
+from slowlog import EXPLAIN, slow_queries
+import metrics
+
+
+def connection_kwargs():
+    # statements run this many times on a connection get a server-side prepared plan;
+    # set DB_PREPARE_THRESHOLD empty to disable (e.g. behind a transaction-mode pgbouncer)
+    threshold = env.get("DB_PREPARE_THRESHOLD", "5")
+    return {"prepare_threshold": int(threshold) if threshold else None}
+
+
+def record_row(record: type):
+    """Row factory building `record(*values)` in column order; `tuple` gives plain tuples.
+
+    Much cheaper than dict_row for wide result sets: no per-row dict, and a
+    __slots__ class (see records.py) serializes straight to JSON.
+    """
+    if record is tuple:
+        return tuple_row
+
+    def factory(cursor):
+        return lambda values: record(*values)
+
+    return factory
+
+
+def create_pool(url=None, timeout=None):
+    return AsyncConnectionPool(
+        url or env.get("CONNECTION_URL"),
+        kwargs=connection_kwargs(),
+        min_size=int(env.get("DB_POOL_MIN_SIZE", 1)),
+        max_size=int(env.get("DB_POOL_MAX_SIZE", 10)),
+        timeout=float(timeout if timeout is not None else env.get("DB_POOL_TIMEOUT", 5)),
+        max_idle=float(env.get("DB_POOL_MAX_IDLE", 30)),
+        check=AsyncConnectionPool.check_connection,
+        open=False,
+    )
+
+
+class AsyncReplicaRouter(ReplicaRouter):
+    """replicas.ReplicaRouter over psycopg AsyncConnectionPools."""
+
+    async def open(self):
+        # no waiting: a replica that is down at startup is just skipped until it answers
+        for pool in self.pools:
+            await pool.open(wait=False)
+
+    async def getconn(self):
+        for index in self.candidates():
+            try:
+                conn = await self.pools[index].getconn()
+            except DatabaseError:
+                self.failed(index)
+                continue
+
+            self.acquired(index)
+            return index, conn
+
+        self.fell_back()
+        return None, None
+
+    async def putconn(self, index: int, conn):
+        self.released(index)
+        await _return(conn, self.pools[index])
+
+    async def close(self):
+        for pool in self.pools:
+            await pool.close()
+
+
+def create_replica_router(urls: list[str] = None) -> AsyncReplicaRouter:
+    urls = urls if urls is not None else replica_urls()
+    if not urls:
+        return None
+
+    timeout = float(env.get("DB_REPLICA_TIMEOUT", 1))
+    return AsyncReplicaRouter([create_pool(url, timeout=timeout) for url in urls])
+
+
+async def _return(conn, pool):
+    # reads (and streams) leave a transaction open; end it here rather than
+    # have the pool warn about and roll back every returned connection
+    if conn.info.transaction_status in (TransactionStatus.INTRANS, TransactionStatus.INERROR):
+        await conn.rollback()
+
+    if pool:
+        await pool.putconn(conn)
+    else:
+        await conn.close()
+
+
+class AsyncDatabase(QueryBuilder):
+    """One request's connections.
+
+    With `replicas`, plain reads go to a replica and the primary connection is
+    only checked out once something needs it. `session` identifies whose writes
+    the read-your-writes window tracks (the user id in the API).
+    """
+
+    def __init__(self, pool: AsyncConnectionPool = None, replicas: AsyncReplicaRouter = None, session=None):
+        self.pool = pool
+        self.replicas = replicas
+        self.session = session
+        self.url = None
+        self.conn = None
+        self.cursor = None
+        self.read_conn = None
+        self.read_cursor = None
+        self.replica_index = None
+        self.primary_reads = False
+        self.depth = 0
+        self.dirty = False
+        self._after_commit = []  # (depth registered at, callback, args)
+
+    async def open(self, url=None):
+        self.url = url
+
+        if not self.replicas:
+            await self._writer()
+
+    async def close(self):
+        await self._release_replica()
+
+        if self.conn is None:
+            return
+
+        await self.cursor.close()
+        await _return(self.conn, self.pool)
+        self.conn = self.cursor = None
+
+    # the rest of this unit of work reads and writes as `session`
+    async def bind(self, session):
+        self.session = session
+
+        if self.replica_index is not None and self.replicas.is_pinned(session):
+            await self._release_replica()
+
+    async def _writer(self):
+        if self.conn is None:
+            if self.pool:
+                self.conn = await self.pool.getconn()
+            else:
+                self.conn = await AsyncConnection.connect(self.url or env.get("CONNECTION_URL"),
+                                                          **connection_kwargs())
+
+            self.cursor = self.conn.cursor(row_factory=dict_row)
+
+        return self.cursor
+
+    async def _reader(self):
+        if self.read_cursor is None:
+            if self.replicas and not self.primary_reads and not self.replicas.is_pinned(self.session):
+                self.replica_index, self.read_conn = await self.replicas.getconn()
+
+            if self.read_conn is None:
+                self.read_cursor = await self._writer()
+                self.read_conn = self.conn
+            else:
+                self.read_cursor = self.read_conn.cursor(row_factory=dict_row)
+
+        return self.read_cursor
+
+    async def _release_replica(self, failed=False):
+        if self.replica_index is not None:
+            if failed:
+                self.replicas.failed(self.replica_index)
+
+            await self.read_cursor.close()
+            await self.replicas.putconn(self.replica_index, self.read_conn)
+
+        self.read_conn = self.read_cursor = self.replica_index = None
+
+    # after every write statement: commit now, or when the outermost transaction() exits
+    async def _wrote(self):
+        self.primary_reads = True
+
+        if self.depth:
+            self.dirty = True
+        else:
+            await self._commit()
+
+        if self.replicas:
+            # later reads in this unit of work must see this write too
+            await self._release_replica()
+
+    async def _commit(self):
+        await self.conn.commit()
+        self.dirty = False
+
+        if self.replicas:
+            self.replicas.record_write(self.session)
+
+    async def after_commit(self, callback, *args):
+        """Await callback(*args) once the outermost transaction() commits, or now outside of one.
+
+        Dropped if the transaction, or the savepoint it was registered in, rolls back. Meant for
+        side effects that must not be seen before the data, e.g. deleting cache entries.
+        """
+        if self.depth:
+            self._after_commit.append((self.depth, callback, args))
+        else:
+            await callback(*args)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Run the enclosed statements as one unit of work.
+
+        The outermost block commits once when it exits and rolls everything back
+        if it raises. A nested block is a savepoint: an exception undoes only the
+        statements inside it, and the outer block can carry on. Nothing is
+        checked out until the first statement needs a connection.
+        """
+        savepoint = None
+
+        if self.depth and self.dirty:
+            await self._writer()
+            savepoint = f"uow_{self.depth}"
+            await self.cursor.execute(f"SAVEPOINT {savepoint}")
+
+        self.depth += 1
+
+        try:
+            yield self
+        except BaseException:
+            if savepoint:
+                await self.cursor.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+            elif self.conn is not None:
+                # nothing worth keeping came before this block
+                await self.conn.rollback()
+                self.dirty = False
+            self._after_commit = [entry for entry in self._after_commit if entry[0] < self.depth]
+            raise
+        else:
+            if savepoint:
+                await self.cursor.execute(f"RELEASE SAVEPOINT {savepoint}")
+            elif self.depth == 1 and self.dirty:
+                await self._commit()
+
+            if self.depth == 1:
+                callbacks, self._after_commit = self._after_commit, []
+                for _, callback, args in callbacks:
+                    await callback(*args)
+            else:
+                # they now stand or fall with the enclosing block
+                self._after_commit = [(min(depth, self.depth - 1), callback, args)
+                                      for depth, callback, args in self._after_commit]
+        finally:
+            if self.depth == 1:
+                self._after_commit = []
+            self.depth -= 1
+
+    async def _read_cursor(self, record=None):
+        cursor = await self._reader()
+        return cursor if record is None else self.read_conn.cursor(row_factory=record_row(record))
+
+    async def _read(self, query, params, record=None):
+        cursor = await self._read_cursor(record)
+
+        try:
+            await self._execute(query, params, cursor, explain=True)
+        except OperationalError:
+            if self.replica_index is None:
+                raise
+
+            # the replica went away mid-request: mark it down and answer from the primary
+            await self._release_replica(failed=True)
+            self.primary_reads = True
+            cursor = await self._read_cursor(record)
+            await self._execute(query, params, cursor, explain=True)
+
+        return cursor
+
+    # explain: the statement is a plain read, safe to run again for the slow-query log
+    async def _execute(self, query, params, cursor=None, explain=False):
+        cursor = cursor or self.cursor
+
+        if not metrics.ENABLED and not slow_queries.enabled:
+            return await cursor.execute(query, params)
+
+        start = perf_counter()
+        await cursor.execute(query, params)
+        duration = perf_counter() - start
+
+        if metrics.ENABLED:
+            metrics.record_query(query, duration, cursor.rowcount)
+
+        if slow_queries.is_slow(duration):
+            plan = None
+            if explain and slow_queries.should_explain(query):
+                plan = await self._explain(cursor, query, params)
+            slow_queries.record(query, params, duration, cursor.rowcount, plan)
+
+    @staticmethod
+    async def _explain(cursor, query, params):
+        # a cursor of its own keeps the caller's rows; the savepoint keeps a failed EXPLAIN
+        # from aborting the transaction around it
+        async with cursor.connection.cursor(row_factory=tuple_row) as explain:
+            await explain.execute("SAVEPOINT slow_query_explain")
+            try:
+                await explain.execute(EXPLAIN + query, params)
+                plan = "\n".join(row[0] for row in await explain.fetchall())
+            except DatabaseError:
+                await explain.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                return None
+            await explain.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan
+
+    async def write(self,
+                    table: str,
+                    columns: list[str],
+                    data: list):
+        await self._writer()
+        await self._execute(*self._write_query(table, columns, data))
+        await self._wrote()
+        return (await self.cursor.fetchone()).get('id')
+
+    async def write_many(self,
+                         table: str,
+                         columns: list[str],
+                         rows: list[list]):
+        ids = []
+
+        async with self.transaction():
+            await self._writer()
+
+            for query, params in self._write_many_queries(table, columns, rows):
+                await self._execute(query, params)
+                ids += [row.get('id') for row in await self.cursor.fetchall()]
+
+            await self._wrote()
+
+        return ids
+
+    async def get(self,
+                  table: str,
+                  columns: list[str],
+                  limit: int = None,
+                  where: dict = None,
+                  or_where: dict = None,
+                  contains: dict = None,
+                  order_by: list[str] = None,
+                  descending: bool = False,
+                  after: list = None,
+                  record: type = None
+                  ):
+        cursor = await self._read(*self._get_query(table, columns, limit, where, or_where, contains,
+                                                   order_by, descending, after), record)
+        return await cursor.fetchall()
+
+    # server-side cursor: yields lists of at most batch_size rows, so memory stays flat
+    # however many rows match. Holds this connection until the generator is exhausted or closed
+    async def stream(self,
+                     table: str,
+                     columns: list[str],
+                     batch_size: int = 1000,
+                     where: dict = None,
+                     or_where: dict = None,
+                     order_by: list[str] = None,
+                     descending: bool = False,
+                     record: type = None):
+        query, params = self._get_query(table, columns, where=where, or_where=or_where,
+                                        order_by=order_by, descending=descending)
+
+        await self._reader()
+        row_factory = dict_row if record is None else record_row(record)
+
+        async with self.read_conn.cursor(name=f"stream_{uuid4().hex}", row_factory=row_factory) as cursor:
+            await self._execute(query, params, cursor)
+
+            while rows := await cursor.fetchmany(batch_size):
+                yield rows
+
+    async def get_one(self,
+                      table: str,
+                      columns: list[str],
+                      where: dict = None,
+                      or_where: dict = None,
+                      record: type = None):
+        result = await self.get(table, columns, 1, where, or_where, record=record)
+        if len(result):
+            return result[0]
+
+    async def get_contains(self,
+                           table: str,
+                           columns: list[str],
+                           search: str,
+                           limit: int = None,
+                           record: type = None):
+        cursor = await self._read(*self._get_contains_query(table, columns, search, limit), record)
+        return await cursor.fetchall()
+
+    async def search(self,
+                     table: str,
+                     columns: list[str],
+                     terms: str,
+                     vector: str = "search",
+                     language: str = "english",
+                     limit: int = None,
+                     where: dict = None,
+                     or_where: dict = None,
+                     after: list = None,
+                     record: type = None):
+        cursor = await self._read(*self._search_query(table, columns, terms, vector, language, limit,
+                                                      where, or_where, after), record)
+        return await cursor.fetchall()
+
+    async def call(self,
+                   function: str,
+                   args: list = ()):
+        await self._writer()
+        await self._execute(*self._call_query(function, args))
+        await self._wrote()
+        return (await self.cursor.fetchone()).get('result')
+
+    async def update(self,
+                     table: str,
+                     columns: list[str],
+                     data: list,
+                     where: dict = None):
+        await self._writer()
+        await self._execute(*self._update_query(table, columns, data, where))
+        await self._wrote()
+        return self.cursor.rowcount
+
+    async def delete(self,
+                     table: str,
+                     where: dict = None):
+        await self._writer()
+        await self._execute(*self._delete_query(table, where))
+        await self._wrote()
+        return self.cursor.rowcount
@@ -0,0 +1,18 @@
+"""Benchmark and load-test suite for the guestbook API.
+
+    python -m benchmarks seed --users 1000 --messages 100000 --upvotes 200000
+    RATE_LIMIT_ENABLED=0 uvicorn main:app
+    python -m benchmarks run --rate 50 --duration 20 --output baseline.json
+    python -m benchmarks compare baseline.json current.json
+
+`seed` rebuilds the schema from DDL.sql in the database named by
+CONNECTION_URL -- point it at a throwaway database. `run` drives every route
+in routers/ at a fixed request rate and writes throughput, latency
+percentiles and queries per request (read from the Server-Timing header) as
+JSON; `compare` diffs two such files and fails on regressions. Start the
+server with RATE_LIMIT_ENABLED=0 as shown, or the rate limits answer most
+of the load with 429s.
+
+The standalone scripts next to this file (bench_*.py, importtime.py, load_test.py,
+hammer_upvote.py) cover single concerns in more depth.
+"""
@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+import json
+import platform
+import sys
+from datetime import datetime, timezone
+from os import environ as env
+from benchmarks import __doc__ as usage
+from benchmarks.compare import compare
+from benchmarks.runner import run
+from benchmarks.scenarios import SCENARIOS, setup
+from benchmarks.seed import seed
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=usage,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_cmd = commands.add_parser("seed", help="rebuild the schema and load synthetic data")
+    seed_cmd.add_argument("--users", type=int, default=1000)
+    seed_cmd.add_argument("--messages", type=int, default=100_000)
+    seed_cmd.add_argument("--upvotes", type=int, default=200_000)
+    seed_cmd.add_argument("--reset", action="store_true", help="drop the tables first (after schema changes)")
+
+    run_cmd = commands.add_parser("run", help="drive every route at a fixed rate")
+    run_cmd.add_argument("--base-url", default="http://127.0.0.1:8000")
+    run_cmd.add_argument("--rate", type=float, default=50, help="requests/sec per scenario")
+    run_cmd.add_argument("--duration", type=float, default=20, help="seconds per scenario")
+    run_cmd.add_argument("--users", type=int, default=1000, help="as passed to seed")
+    run_cmd.add_argument("--only", nargs="*", help="scenario names to run")
+    run_cmd.add_argument("--output", help="write results as JSON here")
+
+    compare_cmd = commands.add_parser("compare", help="diff two result files")
+    compare_cmd.add_argument("baseline")
+    compare_cmd.add_argument("current")
+    compare_cmd.add_argument("--tolerance", type=float, default=0.10, help="allowed regression, as a fraction")
+
+    args = parser.parse_args()
+    url = env.get("CONNECTION_URL")
+
+    if args.command == "seed":
+        print(seed(url, args.users, args.messages, args.upvotes, args.reset))
+
+    elif args.command == "run":
+        scenarios = [s for s in SCENARIOS if not args.only or s.name in args.only]
+        ctx = setup(url, args.users, max(1, int(args.rate * args.duration)))
+        report = asyncio.run(run(args.base_url, scenarios, ctx, args.rate, args.duration))
+
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({
+                    "meta": {
+                        "created_at": datetime.now(timezone.utc).isoformat(),
+                        "rate": args.rate,
+                        "duration": args.duration,
+                        "base_url": args.base_url,
+                        "python": platform.python_version(),
+                    },
+                    "scenarios": report,
+                }, f, indent=2)
+
+    elif args.command == "compare":
+        with open(args.baseline) as f, open(args.current) as g:
+            regressions = compare(json.load(f), json.load(g), args.tolerance)
+
+        if regressions:
+            sys.exit(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
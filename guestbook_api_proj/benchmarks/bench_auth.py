@@ -0,0 +1,45 @@
+"""Cost of authenticating one request with and without the credential cache.
+
+This isolates the CPU side of validate_user (no database). For end-to-end
+numbers run benchmarks/load_test.py against an authenticated route on a
+server started with AUTH_CACHE_SIZE=0 and again with the default.
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cache import TTLCache  # noqa: E402
+from utils import credential_digest, get_password_hash, verify_password  # noqa: E402
+
+
+def timeit(label, fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<14} {n / elapsed:>12.1f} auth/sec  {elapsed / n * 1e6:>10.1f} us/auth")
+
+
+def main():
+    email, password = "bench@example.com", "correct horse battery"
+    hashed = get_password_hash(password)
+    cache = TTLCache()
+
+    def uncached():
+        assert verify_password(password, hashed)
+
+    def cached():
+        key = credential_digest(email, hashed, password)
+        if cache.get(key) != 1:
+            assert verify_password(password, hashed)
+            cache.set(key, 1)
+
+    timeit("bcrypt verify", uncached, 20)
+    timeit("cached", cached, 100_000)
+    print(cache.get_stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Micro-benchmark of statement construction for the GET /messages shape.
+
+Compares composing a psycopg sql.Composed tree with inlined literals on
+every call (the previous approach) against the shape-cached compiler in
+db.QueryBuilder, both cold (cache cleared each call) and warm.
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from psycopg import sql  # noqa: E402
+from query import QueryBuilder, compile_get  # noqa: E402
+
+ARGS = ("guestbook", ["id", "message", "created_at"], 10, {"private": False}, {"private": True, "user_id": 42})
+
+
+def composed(table, columns, limit, where, or_where):
+    def kv_and(pairs):
+        return sql.SQL(" AND ").join(sql.SQL("{} = {}").format(sql.Identifier(k), sql.Literal(v)) for k, v in pairs)
+
+    query = sql.SQL("SELECT {} FROM {}").format(sql.SQL(",").join(map(sql.Identifier, columns)), sql.Identifier(table))
+    query += sql.SQL(" WHERE ({})").format(kv_and(where.items()))
+    query += sql.SQL(" OR ({})").format(kv_and(or_where.items()))
+    query += sql.SQL(" LIMIT {}").format(sql.Literal(limit))
+    return query.as_string(None)
+
+
+def cold():
+    compile_get.cache_clear()
+    return QueryBuilder._get_query(*ARGS)
+
+
+def warm():
+    return QueryBuilder._get_query(*ARGS)
+
+
+def main(n=50_000):
+    for label, fn in (("composed", lambda: composed(*ARGS)), ("compiled cold", cold), ("compiled warm", warm)):
+        start = time.perf_counter()
+        for _ in range(n):
+            fn()
+        elapsed = time.perf_counter() - start
+        print(f"{label:<14} {elapsed / n * 1e6:8.2f} us/query")
+
+    print(compile_get.cache_info())
+
+
+if __name__ == "__main__":
+    main()
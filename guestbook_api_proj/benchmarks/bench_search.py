@@ -0,0 +1,78 @@
+"""LIKE scan vs full-text search over a large guestbook.
+
+Copies the guestbook definition (generated tsvector column and GIN index
+included) into a scratch table, fills it with --rows synthetic messages and
+times both search shapes as QueryBuilder emits them. The scratch table is
+dropped afterwards.
+
+    python benchmarks/bench_search.py --rows 1000000 --term "database index"
+"""
+import argparse
+import sys
+import time
+from os import environ as env
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+from psycopg import connect  # noqa: E402
+from query import QueryBuilder  # noqa: E402
+
+WORDS = ["postgres", "index", "database", "query", "guestbook", "message", "python", "fastapi",
+         "search", "vector", "latency", "cache", "pool", "replica", "upvote", "course", "hello", "world"]
+
+
+def timed(cursor, query, params, runs):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--term", default="database")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    load_dotenv()
+
+    table = "bench_guestbook"
+    where, or_where = {"private": False}, {"private": True, "user_id": 1}
+
+    with connect(env.get("CONNECTION_URL"), autocommit=True) as conn, conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        cursor.execute(f"CREATE TABLE {table} (LIKE guestbook INCLUDING ALL)")
+
+        start = time.perf_counter()
+        cursor.execute(f"""
+            INSERT INTO {table} (message, user_id, private)
+            SELECT (SELECT string_agg(w, ' ') FROM (
+                        SELECT (%s::text[])[1 + floor(random() * %s)::int] AS w
+                        FROM generate_series(1, 8 + (i %% 5))) AS words),
+                   1 + i %% 1000, i %% 10 = 0
+            FROM generate_series(1, %s) AS i
+        """, (WORDS, len(WORDS), args.rows))
+        cursor.execute(f"ANALYZE {table}")
+        print(f"seeded {args.rows} rows in {time.perf_counter() - start:.1f}s")
+
+        try:
+            like = QueryBuilder._get_query(table, ["id", "message"], args.limit, where, or_where,
+                                           contains={"message": args.term})
+            fts = QueryBuilder._search_query(table, ["id", "message"], args.term, limit=args.limit,
+                                             where=where, or_where=or_where)
+
+            for label, (query, params) in (("LIKE", like), ("full-text", fts)):
+                best, count = timed(cursor, query, params, args.runs)
+                print(f"{label:<10} {best * 1000:9.1f} ms  ({count} rows)")
+        finally:
+            cursor.execute(f"DROP TABLE {table}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Per-1k-row cost of building and encoding a GET /messages page.
+
+Rows are built in memory the way each cursor mode builds them (dict per
+row as dict_row does, or records.Message from a tuple as record_row does)
+and then turned into a response body either the default FastAPI way
+(jsonable_encoder, then JSONResponse) or with responses.FastJSONResponse.
+No database or server is involved.
+
+    python benchmarks/bench_serialize.py --rows 1000
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+import responses  # noqa: E402
+from records import Message  # noqa: E402
+
+
+def raw_rows(n):
+    start = datetime(2024, 1, 1)
+    return [(i, f"message number {i} with a few more words in it", start + timedelta(seconds=i)) for i in range(n)]
+
+
+def timeit(label, fn, rows, repeat):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    per_1k = (time.perf_counter() - start) / repeat / rows * 1000
+    print(f"{label:<48} {per_1k * 1000:>9.3f} ms per 1k rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    raw = raw_rows(args.rows)
+    columns = Message.COLUMNS
+    dicts = [dict(zip(columns, row)) for row in raw]
+    records = [Message(*row) for row in raw]
+
+    def fast(content):
+        return responses.FastJSONResponse(content).body
+
+    cases = [
+        ("build: dict per row", lambda: [dict(zip(columns, row)) for row in raw]),
+        ("build: records.Message per row", lambda: [Message(*row) for row in raw]),
+        ("encode: dicts, jsonable_encoder + JSONResponse", lambda: JSONResponse(jsonable_encoder(dicts)).body),
+        ("encode: records, jsonable_encoder + JSONResponse", lambda: JSONResponse(jsonable_encoder(records)).body),
+        ("encode: dicts, FastJSONResponse", lambda: fast(dicts)),
+        ("encode: records, FastJSONResponse", lambda: fast(records)),
+    ]
+
+    print(f"orjson: {'yes' if responses.USE_ORJSON else 'no'}")
+    for label, fn in cases:
+        timeit(label, fn, args.rows, args.repeat)
+
+    if responses.USE_ORJSON:
+        responses.USE_ORJSON = False
+        timeit("encode: records, FastJSONResponse (stdlib)", lambda: fast(records), args.rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Time from launching the server to its first successful response.
+
+Starts `uvicorn main:app` (or `--factory main:create_app` with --factory)
+on a free port, polls --path until it answers 200 and stops the server
+again, --runs times. The time covers interpreter start, imports, building
+the app and the lifespan (opening the pool waits for its first
+connections). --no-db sets DB_POOL_MAX_SIZE=0 and TOKEN_PURGE_INTERVAL=0 so
+nothing connects at startup, which isolates the Python side; /health then
+works without a database.
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --runs 10 --no-db
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from statistics import median
+from urllib.error import URLError
+from urllib.request import urlopen
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def first_success(command, url, env, timeout):
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise SystemExit(f"server exited with {server.returncode}:\n{server.stderr.read().decode()}")
+            try:
+                with urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except (URLError, ConnectionError):
+                pass
+            time.sleep(0.005)
+        raise SystemExit(f"no 200 from {url} within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/health")
+    parser.add_argument("--factory", action="store_true", help="serve main:create_app with --factory")
+    parser.add_argument("--no-db", action="store_true", help="nothing connects to the database at startup")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    env = dict(os.environ, RATE_LIMIT_ENABLED="0")
+    if args.no_db:
+        env.update(DB_POOL_MAX_SIZE="0", TOKEN_PURGE_INTERVAL="0")
+
+    target = ["--factory", "main:create_app"] if args.factory else ["main:app"]
+    times = []
+
+    for _ in range(args.runs):
+        port = free_port()
+        command = [sys.executable, "-m", "uvicorn", *target, "--port", str(port), "--log-level", "warning"]
+        times.append(first_success(command, f"http://127.0.0.1:{port}{args.path}", env, args.timeout))
+
+    times = [t * 1000 for t in times]
+    print(f"time to first 200 on {args.path} over {args.runs} runs: "
+          f"min {min(times):.0f} ms  median {median(times):.0f} ms  max {max(times):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Commits and latency of the write-heavy handlers, per call vs per request.
+
+Replays the statement sequence of /register (user + token), POST /messages
+and PATCH /messages/{id} (read + update) against CONNECTION_URL, once with a
+commit after every statement (the previous behaviour) and once inside one
+Database.transaction() per request (what get_db does now). Commits are read
+from pg_stat_database, so run it against an otherwise idle throwaway
+database. Rows it creates are deleted afterwards.
+
+    python benchmarks/bench_uow.py --requests 500 --concurrency 10
+"""
+import argparse
+import asyncio
+import sys
+import time
+from contextlib import asynccontextmanager
+from os import environ as env
+from pathlib import Path
+from uuid import uuid4
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+from psycopg import AsyncConnection  # noqa: E402
+from async_db import AsyncDatabase  # noqa: E402
+
+PREFIX = "bench-uow-"
+
+
+@asynccontextmanager
+async def per_call(db):
+    yield db
+
+
+def per_request(db):
+    return db.transaction()
+
+
+async def register(db):
+    user_id = await db.write("users", ["email", "password"], [f"{PREFIX}{uuid4().hex}@example.com", "x"])
+    await db.write("tokens", ["token", "user_id"], [str(uuid4()), user_id])
+    return user_id
+
+
+async def post_message(db, user_id):
+    return await db.write("guestbook", ["user_id", "message", "private"], [user_id, PREFIX + "hello", False])
+
+
+async def patch_message(db, user_id, message_id):
+    message = await db.get_one("guestbook", ["id", "user_id"], where={"id": message_id})
+    if message.get("user_id") == user_id:
+        await db.update("guestbook", ["message", "private"], [PREFIX + "edited", True], where={"id": message_id})
+
+
+async def handler(url, unit_of_work, step):
+    db = AsyncDatabase()
+    await db.open(url)
+    try:
+        started = time.perf_counter()
+        async with unit_of_work(db):
+            user_id = await register(db)
+            if step != "register":
+                message_id = await post_message(db, user_id)
+            if step == "patch":
+                await patch_message(db, user_id, message_id)
+        return time.perf_counter() - started
+    finally:
+        await db.close()
+
+
+async def commits(url):
+    async with await AsyncConnection.connect(url, autocommit=True) as conn:
+        cursor = await conn.execute("SELECT xact_commit FROM pg_stat_database WHERE datname = current_database()")
+        return (await cursor.fetchone())[0]
+
+
+async def run(url, unit_of_work, step, requests, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with limit:
+            return await handler(url, unit_of_work, step)
+
+    before = await commits(url)
+    started = time.perf_counter()
+    latencies = sorted(await asyncio.gather(*(one() for _ in range(requests))))
+    elapsed = time.perf_counter() - started
+    # the two pg_stat_database reads commit too; statistics are flushed lazily, so give them a moment
+    await asyncio.sleep(1)
+    committed = await commits(url) - before - 1
+
+    return {
+        "commits_per_request": committed / requests,
+        "requests_per_sec": requests / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+async def cleanup(url):
+    async with await AsyncConnection.connect(url, autocommit=True) as conn:
+        await conn.execute("DELETE FROM users WHERE email LIKE %s", (PREFIX + "%",))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    load_dotenv()
+    url = env.get("CONNECTION_URL")
+
+    try:
+        for step in ("register", "post", "patch"):
+            for label, unit_of_work in (("per call", per_call), ("per request", per_request)):
+                result = await run(url, unit_of_work, step, args.requests, args.concurrency)
+                print(f"{step:<9} {label:<12} " + "  ".join(f"{k} {v:8.2f}" for k, v in result.items()))
+    finally:
+        await cleanup(url)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+"""Diff two `run` result files."""
+
+# metric -> True when a higher value is better
+METRICS = {"throughput": True, "p50_ms": False, "p95_ms": False, "p99_ms": False, "queries_per_request": False}
+
+
+def compare(baseline: dict, current: dict, tolerance: float = 0.10):
+    """Print per-scenario deltas; return the regressions beyond `tolerance` (a fraction)."""
+    regressions = []
+
+    for name, before in baseline["scenarios"].items():
+        after = current["scenarios"].get(name)
+        if after is None:
+            print(f"{name:<16} missing from current run")
+            continue
+
+        cells = []
+        for metric, higher_is_better in METRICS.items():
+            old, new = before.get(metric), after.get(metric)
+            if not old or new is None:
+                continue
+
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = " !" if worse > tolerance else ""
+            cells.append(f"{metric} {old:.1f}->{new:.1f} ({change:+.0%}){flag}")
+
+            if worse > tolerance:
+                regressions.append((name, metric, old, new))
+
+        if after.get("errors", 0) > before.get("errors", 0):
+            regressions.append((name, "errors", before.get("errors", 0), after["errors"]))
+
+        print(f"{name:<16} " + "  ".join(cells))
+
+    return regressions
@@ -0,0 +1,89 @@
+"""Concurrency check for the atomic upvote path.
+
+Fires --concurrency simultaneous upvote_message() calls for the same voter
+and message from separate connections and verifies that exactly one
+succeeds and the message's counter moved by exactly one. The upvote is
+removed again afterwards. Exits non-zero on a violation.
+
+    python benchmarks/hammer_upvote.py --voter 2 --message 1 --concurrency 50
+
+tests/test_upvote_concurrency.py runs the same check on throwaway rows
+whenever CONNECTION_URL is set.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from collections import Counter
+from os import environ as env
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+from psycopg import AsyncConnection  # noqa: E402
+from async_db import AsyncDatabase  # noqa: E402
+
+
+async def upvote(url, voter, message, start):
+    db = AsyncDatabase()
+    await db.open(url)
+    try:
+        await start.wait()
+        return await db.call("upvote_message", [voter, message])
+    finally:
+        await db.close()
+
+
+async def upvote_count(url, message):
+    db = AsyncDatabase()
+    await db.open(url)
+    try:
+        return (await db.get_one("guestbook", ["upvote_count"], where={"id": message}))["upvote_count"]
+    finally:
+        await db.close()
+
+
+async def hammer(url, voter, message, concurrency):
+    """(result counts, counter before, counter after, seconds) for `concurrency` simultaneous upvotes."""
+    before = await upvote_count(url, message)
+    start = asyncio.Event()
+    tasks = [asyncio.create_task(upvote(url, voter, message, start)) for _ in range(concurrency)]
+    await asyncio.sleep(0.5)  # let every connection open before releasing them together
+
+    started = time.perf_counter()
+    start.set()
+    results = Counter(await asyncio.gather(*tasks))
+    elapsed = time.perf_counter() - started
+    after = await upvote_count(url, message)
+
+    async with await AsyncConnection.connect(url) as conn:
+        await conn.execute("DELETE FROM upvotes WHERE user_id = %s AND message_id = %s", (voter, message))
+
+    return results, before, after, elapsed
+
+
+def double_counted(results, before, after) -> bool:
+    return results["upvoted"] > 1 or after - before != results["upvoted"]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--voter", type=int, required=True)
+    parser.add_argument("--message", type=int, required=True)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    load_dotenv()
+
+    results, before, after, elapsed = await hammer(env.get("CONNECTION_URL"), args.voter, args.message,
+                                                   args.concurrency)
+    print(f"{dict(results)} in {elapsed * 1000:.1f} ms, counter {before} -> {after}")
+
+    if double_counted(results, before, after):
+        sys.exit("FAIL: concurrent upvotes were double counted")
+
+    print("OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
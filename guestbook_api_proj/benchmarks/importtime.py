@@ -0,0 +1,93 @@
+"""Where `import main` spends its time, from python -X importtime.
+
+Imports the module in a fresh interpreter --repeat times, keeps each
+module's median, and prints the slowest ones by cumulative time (the module
+and everything it pulled in) with the chain of imports that brought them
+in, then the slowest by self time. Packages from this project are marked
+with *; anything heavy that only some requests need is a candidate for a
+lazy import.
+
+    python benchmarks/importtime.py --top 20
+    python benchmarks/importtime.py --module routers.messages
+"""
+import argparse
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from statistics import median
+
+ROOT = Path(__file__).resolve().parent.parent
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def profile(module):
+    """One run; (name, self µs, cumulative µs, parent name) per module, in import order."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode:
+        raise SystemExit(result.stderr)
+
+    # a module is printed after everything it imported, one level less indented
+    entries, children = [], []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        own, cumulative, indent, name = match.groups()
+        depth = len(indent) // 2
+
+        entry = [name, int(own), int(cumulative), None]
+        while children and children[-1][0] > depth:
+            children.pop()[1][3] = name
+        children.append((depth, entry))
+        entries.append(entry)
+
+    return entries
+
+
+def chain(name, parents):
+    names = [name]
+    while parents.get(names[-1]):
+        names.append(parents[names[-1]])
+    return " < ".join(names)
+
+
+def local(name):
+    top = name.split(".")[0]
+    return (ROOT / f"{top}.py").exists() or (ROOT / top / "__init__.py").exists()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    own, cumulative, parents = defaultdict(list), defaultdict(list), {}
+    for _ in range(args.repeat):
+        for name, self_us, cumulative_us, parent in profile(args.module):
+            own[name].append(self_us)
+            cumulative[name].append(cumulative_us)
+            parents.setdefault(name, parent)
+
+    own = {name: median(times) / 1000 for name, times in own.items()}
+    cumulative = {name: median(times) / 1000 for name, times in cumulative.items()}
+    total = cumulative.get(args.module, 0)
+
+    print(f"import {args.module}: {total:.1f} ms over {len(cumulative)} modules (median of {args.repeat})\n")
+
+    print(f"{'cumulative ms':>13} {'%':>5}  module < imported by")
+    for name in sorted(cumulative, key=cumulative.get, reverse=True)[:args.top]:
+        marker = "*" if local(name) else " "
+        print(f"{cumulative[name]:13.1f} {100 * cumulative[name] / total:5.1f} {marker}{chain(name, parents)}")
+
+    print(f"\n{'self ms':>13}  module")
+    for name in sorted(own, key=own.get, reverse=True)[:args.top]:
+        print(f"{own[name]:13.1f}  {'*' if local(name) else ' '}{name}")
+
+
+if __name__ == "__main__":
+    main()
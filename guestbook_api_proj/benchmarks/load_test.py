@@ -0,0 +1,66 @@
+"""Closed-loop load test for a running guestbook API.
+
+Run it once against a server started with the default pool and once against a
+server started with DB_POOL_MAX_SIZE=0 (a new connection per request) to see
+the requests/sec difference:
+
+    uvicorn main:app --workers 1
+    python benchmarks/load_test.py --path /messages --user me@example.com --password secret123
+"""
+import argparse
+import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+
+def worker(url, headers, deadline):
+    latencies, errors = [], 0
+
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            with urlopen(Request(url, headers=headers)) as response:
+                response.read()
+            latencies.append(time.perf_counter() - start)
+        except (HTTPError, OSError):
+            errors += 1
+
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", default="/messages/most_upvoted")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    headers = {}
+    if args.user:
+        token = base64.b64encode(f"{args.user}:{args.password}".encode()).decode()
+        headers["Authorization"] = f"Basic {token}"
+
+    deadline = time.perf_counter() + args.duration
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        futures = [executor.submit(worker, args.base_url + args.path, headers, deadline)
+                   for _ in range(args.concurrency)]
+        results = [f.result() for f in futures]
+
+    latencies = sorted(l for lats, _ in results for l in lats)
+    errors = sum(e for _, e in results)
+
+    print(f"requests:  {len(latencies)} ok, {errors} failed")
+    print(f"req/sec:   {len(latencies) / args.duration:.1f}")
+    if len(latencies) > 1:
+        cuts = quantiles(latencies, n=100)
+        print(f"latency:   p50={cuts[49] * 1000:.1f}ms p95={cuts[94] * 1000:.1f}ms p99={cuts[98] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Open-loop driver: requests are sent on a fixed schedule, not when the previous one returns,
+so a slow server shows up as latency instead of quietly lowering the offered load."""
+import asyncio
+import re
+import time
+from statistics import mean, quantiles
+import httpx
+
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+async def _timed(scenario, client, ctx, i):
+    start = time.perf_counter()
+    try:
+        response = await scenario.request(client, ctx, i)
+    except httpx.HTTPError:
+        return time.perf_counter() - start, None, None
+
+    match = SERVER_TIMING_QUERIES.search(response.headers.get("server-timing", ""))
+    return time.perf_counter() - start, response.status_code, int(match.group(1)) if match else None
+
+
+def summarize(results, duration):
+    ok = [r for r in results if r[1] is not None]
+    latencies = sorted(r[0] for r in ok)
+    queries = [r[2] for r in ok if r[2] is not None]
+    cuts = quantiles(latencies, n=100) if len(latencies) > 1 else [latencies[0] if latencies else 0.0] * 99
+
+    return {
+        "requests": len(results),
+        "errors": sum(1 for r in results if r[3]),
+        "throughput": len(ok) / duration,
+        "p50_ms": cuts[49] * 1000,
+        "p95_ms": cuts[94] * 1000,
+        "p99_ms": cuts[98] * 1000,
+        "queries_per_request": mean(queries) if queries else None,
+    }
+
+
+async def drive(client, scenario, ctx, rate, duration):
+    loop = asyncio.get_running_loop()
+    total = max(1, int(rate * duration))
+    start = loop.time()
+    tasks = []
+
+    for i in range(total):
+        await asyncio.sleep(max(0.0, start + i / rate - loop.time()))
+        tasks.append(asyncio.create_task(_timed(scenario, client, ctx, i)))
+
+    results = await asyncio.gather(*tasks)
+    elapsed = loop.time() - start
+    # a request is an error if it failed outright or returned a status the scenario does not expect
+    results = [(lat, code, q, code not in scenario.ok_statuses) for lat, code, q in results]
+    return summarize(results, elapsed)
+
+
+async def run(base_url, scenarios, ctx, rate, duration, timeout=30.0):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    report = {}
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        for scenario in scenarios:
+            report[scenario.name] = await drive(client, scenario, ctx, rate, duration)
+            print(f"{scenario.name:<16} " + "  ".join(
+                f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}" for k, v in report[scenario.name].items()
+            ))
+
+    return report
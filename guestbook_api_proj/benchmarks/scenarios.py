@@ -0,0 +1,127 @@
+"""One scenario per route in routers/, each a single request.
+
+A scenario gets the shared client, the run context prepared by setup() and
+its request index, and returns the response.
+"""
+import random
+from collections import namedtuple
+from json import dumps
+from uuid import uuid4
+from psycopg import connect
+from benchmarks.seed import PASSWORD, WORDS, user_email
+
+Scenario = namedtuple("Scenario", ["name", "request", "ok_statuses"])
+
+
+class Context:
+    def __init__(self, users, per_scenario):
+        self.users = users
+        self.rng = random.Random(42)
+        self.run_id = uuid4().hex[:8]
+        self.per_scenario = per_scenario
+        self.own_messages = []
+        self.deletable = []
+        self.tokens = []
+
+    def auth(self, n=None):
+        n = n if n is not None else self.rng.randint(1, self.users)
+        return user_email(n), PASSWORD
+
+    def sentence(self, words=8):
+        return " ".join(self.rng.choice(WORDS) for _ in range(words))
+
+
+def setup(url, users, per_scenario):
+    """Rows that write scenarios consume: user 1's own messages and activation tokens."""
+    ctx = Context(users, per_scenario)
+
+    with connect(url, autocommit=True) as conn:
+        ctx.own_messages = [r[0] for r in conn.execute("""
+            INSERT INTO guestbook (message, user_id) SELECT 'benchmark own message ' || n, 1
+            FROM generate_series(1, %s) AS n RETURNING id
+        """, (per_scenario * 2,)).fetchall()]
+        ctx.deletable = ctx.own_messages[per_scenario:]
+        ctx.own_messages = ctx.own_messages[:per_scenario]
+
+        ctx.tokens = [r[0] for r in conn.execute("""
+            WITH new_users AS (
+                INSERT INTO users (email, password)
+                SELECT 'activate-' || %s || '-' || n || '@example.com', 'x' FROM generate_series(1, %s) AS n
+                RETURNING id)
+            INSERT INTO tokens (token, user_id) SELECT gen_random_uuid()::text, id FROM new_users RETURNING token
+        """, (ctx.run_id, per_scenario)).fetchall()]
+
+    return ctx
+
+
+async def most_upvoted(client, ctx, i):
+    return await client.get("/messages/most_upvoted")
+
+
+async def list_messages(client, ctx, i):
+    return await client.get("/messages", params={"num": 20}, auth=ctx.auth())
+
+
+async def search(client, ctx, i):
+    return await client.get("/messages/search", params={"search_term": ctx.sentence(2), "num": 10},
+                            auth=ctx.auth())
+
+
+async def get_message(client, ctx, i):
+    # random ids: a mix of visible, private (404) and hits on the response cache
+    return await client.get(f"/messages/{ctx.rng.randint(1, 1000)}", auth=ctx.auth())
+
+
+async def write_message(client, ctx, i):
+    return await client.post("/messages", data={"message": ctx.sentence()}, auth=ctx.auth())
+
+
+async def bulk_write(client, ctx, i):
+    body = "".join(dumps({"message": ctx.sentence()}) + "\n" for _ in range(100))
+    return await client.post("/messages/bulk", content=body,
+                             headers={"Content-Type": "application/x-ndjson"}, auth=ctx.auth())
+
+
+async def update_message(client, ctx, i):
+    message_id = ctx.own_messages[i % len(ctx.own_messages)]
+    return await client.patch(f"/messages/{message_id}", data={"message": ctx.sentence()}, auth=ctx.auth(1))
+
+
+async def delete_message(client, ctx, i):
+    return await client.delete(f"/messages/{ctx.deletable[i % len(ctx.deletable)]}", auth=ctx.auth(1))
+
+
+async def upvote(client, ctx, i):
+    return await client.post(f"/messages/{ctx.rng.randint(1, 1000)}/upvote", auth=ctx.auth())
+
+
+async def export(client, ctx, i):
+    async with client.stream("GET", "/messages/export", auth=ctx.auth()) as response:
+        async for _ in response.aiter_bytes():
+            pass
+    return response
+
+
+async def register(client, ctx, i):
+    return await client.post("/register", params={"email": f"register-{ctx.run_id}-{i}@example.com",
+                                                  "password": PASSWORD})
+
+
+async def activate(client, ctx, i):
+    return await client.post("/activate", params={"token": ctx.tokens[i % len(ctx.tokens)]})
+
+
+SCENARIOS = [
+    Scenario("most_upvoted", most_upvoted, {200}),
+    Scenario("list_messages", list_messages, {200}),
+    Scenario("search", search, {200}),
+    Scenario("get_message", get_message, {200, 404}),
+    Scenario("write_message", write_message, {200}),
+    Scenario("bulk_write", bulk_write, {200}),
+    Scenario("update_message", update_message, {200}),
+    Scenario("delete_message", delete_message, {200, 404}),
+    Scenario("upvote", upvote, {200, 403, 404}),
+    Scenario("export", export, {200}),
+    Scenario("register", register, {201}),
+    Scenario("activate", activate, {200, 400}),
+]
@@ -0,0 +1,65 @@
+"""Deterministic test data for benchmark runs."""
+from pathlib import Path
+from psycopg import connect
+from utils import get_password_hash
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# every seeded user logs in with bench{n}@example.com and this password
+PASSWORD = "benchmark-password"
+
+WORDS = ["postgres", "index", "database", "query", "guestbook", "message", "python", "fastapi",
+         "search", "vector", "latency", "cache", "pool", "replica", "upvote", "course", "hello", "world"]
+
+
+def user_email(n: int) -> str:
+    return f"bench{n}@example.com"
+
+
+def seed(url, users=1000, messages=100_000, upvotes=200_000, reset=False, seed_value=0.42):
+    with connect(url, autocommit=True) as conn:
+        if reset:
+            conn.execute("DROP TABLE IF EXISTS upvotes, tokens, guestbook, users CASCADE")
+
+        conn.execute((ROOT / "DDL.sql").read_text())
+        conn.execute("TRUNCATE users RESTART IDENTITY CASCADE")
+        conn.execute("SELECT setseed(%s)", (seed_value,))
+
+        conn.execute("""
+            INSERT INTO users (email, password, active, activated_at)
+            SELECT 'bench' || n || '@example.com', %s, true, now()
+            FROM generate_series(1, %s) AS n
+        """, (get_password_hash(PASSWORD), users))
+
+        conn.execute("""
+            INSERT INTO guestbook (message, user_id, private, created_at)
+            SELECT (SELECT string_agg(w, ' ') FROM (
+                        SELECT (%(words)s::text[])[1 + floor(random() * %(word_count)s)::int] AS w
+                        FROM generate_series(1, 6 + n %% 6)) AS words),
+                   1 + floor(random() * %(users)s)::int,
+                   random() < 0.1,
+                   now() - random() * interval '365 days'
+            FROM generate_series(1, %(messages)s) AS n
+        """, {"words": WORDS, "word_count": len(WORDS), "users": users, "messages": messages})
+
+        # counters are rebuilt once at the end instead of by the upvotes_count_* triggers
+        conn.execute("ALTER TABLE upvotes DISABLE TRIGGER USER")
+        try:
+            conn.execute("""
+                INSERT INTO upvotes (user_id, message_id)
+                SELECT 1 + floor(random() * %s)::int, 1 + floor(random() * %s)::int
+                FROM generate_series(1, %s)
+                ON CONFLICT (user_id, message_id) DO NOTHING
+            """, (users, messages, upvotes))
+            conn.execute("DELETE FROM upvotes AS u USING guestbook AS g WHERE g.id = u.message_id AND g.user_id = u.user_id")
+        finally:
+            conn.execute("ALTER TABLE upvotes ENABLE TRIGGER USER")
+
+        conn.execute("SELECT repair_upvote_counts()")
+        conn.execute("ANALYZE")
+
+        counts = conn.execute("""
+            SELECT (SELECT count(*) FROM users), (SELECT count(*) FROM guestbook), (SELECT count(*) FROM upvotes)
+        """).fetchone()
+
+    return dict(zip(["users", "messages", "upvotes"], counts))
@@ -0,0 +1,141 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+_MISSING = object()
+
+
+class TTLCache:
+    """A bounded in-process LRU whose entries also expire after `ttl` seconds.
+
+    A `maxsize` of 0 disables the cache: every lookup is a miss.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            expires_at, value = self._data.get(key, (0, _MISSING))
+
+            if value is _MISSING or expires_at <= monotonic():
+                self._data.pop(key, None)
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        if not self.maxsize:
+            return
+
+        with self._lock:
+            self._data[key] = (monotonic() + (ttl if ttl is not None else self.ttl), value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class CacheBackend:
+    """What the routers need from a response cache.
+
+    Async so that a shared store (e.g. redis) can implement it; such a backend is
+    responsible for serializing values. Cached values must not be mutated.
+    """
+
+    async def get(self, key: str):
+        """Return the cached value, or None on a miss."""
+        raise NotImplementedError
+
+    async def set(self, key: str, value, ttl: float = None):
+        raise NotImplementedError
+
+    async def delete(self, *keys: str):
+        raise NotImplementedError
+
+    def get_stats(self) -> dict:
+        raise NotImplementedError
+
+
+class LocalCache(CacheBackend):
+    """Per-process LRU with TTL; invalidations only reach this worker, the TTL bounds the rest."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30):
+        self._cache = TTLCache(maxsize, ttl)
+        self.invalidations = 0
+
+    async def get(self, key):
+        return self._cache.get(key)
+
+    async def set(self, key, value, ttl=None):
+        self._cache.set(key, value, ttl)
+
+    async def delete(self, *keys):
+        self.invalidations += len(keys)
+        for key in keys:
+            self._cache.delete(key)
+
+    def get_stats(self):
+        return {**self._cache.get_stats(), "invalidations": self.invalidations}
+
+
+class DictCache(CacheBackend):
+    """Unbounded, never-expiring stand-in for tests."""
+
+    def __init__(self):
+        self.data = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, key):
+        if key in self.data:
+            self.hits += 1
+            return self.data[key]
+
+        self.misses += 1
+
+    async def set(self, key, value, ttl=None):
+        self.data[key] = value
+
+    async def delete(self, *keys):
+        self.invalidations += len(keys)
+        for key in keys:
+            self.data.pop(key, None)
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
@@ -1,168 +1,267 @@
-from psycopg2 import connect, sql
+from contextlib import contextmanager
+from time import perf_counter
+from uuid import uuid4
+from psycopg2 import connect, Error as DatabaseError
 from psycopg2.extras import RealDictCursor
-from dotenv import load_dotenv
 from os import environ as env
+from query import QueryBuilder
+from slowlog import EXPLAIN, slow_queries
+import metrics
 
-load_dotenv()
 
+class Database(QueryBuilder):
+    """Blocking counterpart of async_db.AsyncDatabase, kept for scripts.
+
+    Scripts talk to the primary only; replica routing lives in the API's
+    AsyncDatabase.
+    """
 
-class Database:
     def __init__(self):
+        self.url = None
         self.conn = None
         self.cursor = None
-
+        self.depth = 0
+        self.dirty = False
 
     def open(self, url=None):
-        if not url:
-            url = env.get("CONNECTION_URL")
-
-        self.conn = connect(url)
-        self.cursor = self.conn.cursor(cursor_factory=RealDictCursor)
-        
+        self.url = url
+        self._writer()
 
     def close(self):
+        if self.conn is None:
+            return
+
         self.cursor.close()
         self.conn.close()
-        
-        
+        self.conn = self.cursor = None
+
+    def _writer(self):
+        if self.conn is None:
+            self.conn = connect(self.url or env.get("CONNECTION_URL"))
+            self.cursor = self.conn.cursor(cursor_factory=RealDictCursor)
+
+        return self.cursor
+
+    # after every write statement: commit now, or when the outermost transaction() exits
+    def _wrote(self):
+        if self.depth:
+            self.dirty = True
+        else:
+            self._commit()
+
+    def _commit(self):
+        self.conn.commit()
+        self.dirty = False
+
+    @contextmanager
+    def transaction(self):
+        """Run the enclosed statements as one unit of work.
+
+        The outermost block commits once when it exits and rolls everything back
+        if it raises. A nested block is a savepoint: an exception undoes only the
+        statements inside it, and the outer block can carry on. Nothing is
+        checked out until the first statement needs a connection.
+        """
+        savepoint = None
+
+        if self.depth and self.dirty:
+            self._writer()
+            savepoint = f"uow_{self.depth}"
+            self.cursor.execute(f"SAVEPOINT {savepoint}")
+
+        self.depth += 1
+
+        try:
+            yield self
+        except BaseException:
+            if savepoint:
+                self.cursor.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+            elif self.conn is not None:
+                # nothing worth keeping came before this block
+                self.conn.rollback()
+                self.dirty = False
+            raise
+        else:
+            if savepoint:
+                self.cursor.execute(f"RELEASE SAVEPOINT {savepoint}")
+            elif self.depth == 1 and self.dirty:
+                self._commit()
+        finally:
+            self.depth -= 1
+
+    # psycopg2 has no row factories: record reads use a plain tuple cursor and _records()
+    def _read_cursor(self, record=None):
+        cursor = self._writer()
+        return cursor if record is None else self.conn.cursor()
 
     @staticmethod
-    def _compose_kv_and(separator=" AND ", kv_pairs=None):
-        return sql.SQL(separator).join(
-            sql.SQL("{} = {}").format(
-                sql.Identifier(k), sql.Literal(v)) for k, v in kv_pairs
-        )
+    def _records(rows, record=None):
+        if record is None or record is tuple:
+            return rows
+        return [record(*row) for row in rows]
+
+    def _read(self, query, params, record=None):
+        cursor = self._read_cursor(record)
+        self._execute(query, params, cursor, explain=True)
+        return cursor
+
+    # explain: the statement is a plain read, safe to run again for the slow-query log
+    def _execute(self, query, params, cursor=None, explain=False):
+        cursor = cursor or self.cursor
+
+        if not metrics.ENABLED and not slow_queries.enabled:
+            return cursor.execute(query, params)
+
+        start = perf_counter()
+        cursor.execute(query, params)
+        duration = perf_counter() - start
+
+        if metrics.ENABLED:
+            metrics.record_query(query, duration, cursor.rowcount)
+
+        if slow_queries.is_slow(duration):
+            plan = None
+            if explain and slow_queries.should_explain(query):
+                plan = self._explain(cursor, query, params)
+            slow_queries.record(query, params, duration, cursor.rowcount, plan)
+
+    @staticmethod
+    def _explain(cursor, query, params):
+        # a cursor of its own keeps the caller's rows; the savepoint keeps a failed EXPLAIN
+        # from aborting the transaction around it
+        with cursor.connection.cursor() as explain:
+            explain.execute("SAVEPOINT slow_query_explain")
+            try:
+                explain.execute(EXPLAIN + query, params)
+                plan = "\n".join(row[0] for row in explain.fetchall())
+            except DatabaseError:
+                explain.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                return None
+            explain.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan
 
     def write(self,
               table: str,
               columns: list[str],
               data: list):
-        query = sql.SQL("INSERT INTO {} ({}) VALUES ({}) RETURNING id").format(
-            sql.Identifier(table),
-            sql.SQL(",").join(map(sql.Identifier, columns)),
-            sql.SQL(",").join(map(sql.Literal, data)),
-        )
-
-        self.cursor.execute(query)
-        self.conn.commit()
+        self._writer()
+        self._execute(*self._write_query(table, columns, data))
+        self._wrote()
         return self.cursor.fetchone().get('id')
 
+    # all rows in one transaction: either every id comes back or nothing is written
+    def write_many(self,
+                   table: str,
+                   columns: list[str],
+                   rows: list[list]):
+        ids = []
+
+        with self.transaction():
+            self._writer()
+
+            for query, params in self._write_many_queries(table, columns, rows):
+                self._execute(query, params)
+                ids += [row.get('id') for row in self.cursor.fetchall()]
+
+            self._wrote()
+
+        return ids
+
     def get(self,
             table: str,
             columns: list[str],
             limit: int = None,
             where: dict = None,
             or_where: dict = None,
-            contains: dict = None
+            contains: dict = None,
+            order_by: list[str] = None,
+            descending: bool = False,
+            after: list = None,
+            record: type = None
             ):
+        cursor = self._read(*self._get_query(table, columns, limit, where, or_where, contains,
+                                             order_by, descending, after), record)
+        return self._records(cursor.fetchall(), record)
 
-        query = sql.SQL("SELECT {} FROM {}").format(
-            sql.SQL(',').join(map(sql.Identifier, columns)),
-            sql.Identifier(table)
-        )
-
-        if contains:
-            query += sql.SQL(" WHERE {}").format(
-                sql.SQL(" OR ").join(
-                    sql.SQL("{} LIKE {}").format(
-                        sql.Identifier(k),
-                        sql.Literal(f"%{v}%")
-                    ) for k, v in contains.items()
-                ))
-
-        if where:
-            starter = sql.SQL(" WHERE ({})")
-
-            if contains:
-                if or_where:
-                    starter = sql.SQL(" AND (({})")
-                else:
-                    starter = sql.SQL(" AND ({})")
-
-            query += starter.format(
-                self._compose_kv_and(kv_pairs=where.items())
-            )
-
-        if where and or_where:
-            query += sql.SQL(" OR ({})").format(
-                self._compose_kv_and(kv_pairs=or_where.items())
-            )
+    def stream(self,
+               table: str,
+               columns: list[str],
+               batch_size: int = 1000,
+               where: dict = None,
+               or_where: dict = None,
+               order_by: list[str] = None,
+               descending: bool = False,
+               record: type = None):
+        query, params = self._get_query(table, columns, where=where, or_where=or_where,
+                                        order_by=order_by, descending=descending)
 
-            if contains:
-                query += sql.SQL(")")
+        self._writer()
+        cursor_factory = RealDictCursor if record is None else None
 
-        if limit:
-            query += sql.SQL(" LIMIT {}").format(sql.Literal(limit))
+        with self.conn.cursor(f"stream_{uuid4().hex}", cursor_factory=cursor_factory) as cursor:
+            self._execute(query, params, cursor)
 
-        self.cursor.execute(query)
-        return self.cursor.fetchall()
+            while rows := cursor.fetchmany(batch_size):
+                yield self._records(rows, record)
 
     def get_one(self,
                 table: str,
                 columns: list[str],
-                where: dict = None):
-        result = self.get(table, columns, 1, where)  # [{}]
+                where: dict = None,
+                or_where: dict = None,
+                record: type = None):
+        result = self.get(table, columns, 1, where, or_where, record=record)  # [{}]
         if len(result):
             return result[0]  # {}
 
-    # ...WHERE col1 like '%search%' OR col2 like '%search%'
     def get_contains(self,
                      table: str,
                      columns: list[str],
                      search: str,
-                     limit: int = None):
-        query = sql.SQL("SELECT {} FROM {} WHERE {}").format(
-            sql.SQL(',').join(map(sql.Identifier, columns)),
-            sql.Identifier(table),
-            sql.SQL(" OR ").join(
-                sql.SQL("{} LIKE {}").format(
-                    sql.Identifier(k), sql.Literal(f"%{search}%")) for k in columns
-            )
-        )
-
-        if limit:
-            query += sql.SQL(" LIMIT {}").format(sql.Literal(limit))
-
-        self.cursor.execute(query)
-        return self.cursor.fetchall()
+                     limit: int = None,
+                     record: type = None):
+        cursor = self._read(*self._get_contains_query(table, columns, search, limit), record)
+        return self._records(cursor.fetchall(), record)
+
+    # ...WHERE vector @@ websearch_to_tsquery('english', terms) ORDER BY rank DESC
+    def search(self,
+               table: str,
+               columns: list[str],
+               terms: str,
+               vector: str = "search",
+               language: str = "english",
+               limit: int = None,
+               where: dict = None,
+               or_where: dict = None,
+               after: list = None,
+               record: type = None):
+        cursor = self._read(*self._search_query(table, columns, terms, vector, language, limit,
+                                                where, or_where, after), record)
+        return self._records(cursor.fetchall(), record)
+
+    # SELECT function(args) -- for logic that lives in the database
+    def call(self,
+             function: str,
+             args: list = ()):
+        self._writer()
+        self._execute(*self._call_query(function, args))
+        self._wrote()
+        return self.cursor.fetchone().get('result')
 
     def update(self,
                table: str,
                columns: list[str],
                data: list,
                where: dict = None):
-        where_clause = sql.SQL("")
-
-        if where:
-            where_clause = sql.SQL("WHERE {}").format(
-                self._compose_kv_and(kv_pairs=where.items())
-            )
-
-        query = sql.SQL("UPDATE {} SET {} {}").format(
-            sql.Identifier(table),
-            self._compose_kv_and(separator=",", kv_pairs=zip(columns, data)),
-            where_clause
-        )
-
-        self.cursor.execute(query)
-        self.conn.commit()
+        self._writer()
+        self._execute(*self._update_query(table, columns, data, where))
+        self._wrote()
         return self.cursor.rowcount
 
     def delete(self,
                table: str,
                where: dict = None):
-        where_clause = sql.SQL("")
-
-        if where:
-            where_clause = sql.SQL("WHERE {}").format(
-                self._compose_kv_and(kv_pairs=where.items())
-            )
-
-        query = sql.SQL("DELETE FROM {} {}").format(
-            sql.Identifier(table),
-            where_clause
-        )
-
-        self.cursor.execute(query)
-        self.conn.commit()
+        self._writer()
+        self._execute(*self._delete_query(table, where))
+        self._wrote()
         return self.cursor.rowcount
@@ -1,28 +1,77 @@
-from db import Database
-from fastapi import Depends, HTTPException, status
+from os import environ as env
+from async_db import AsyncDatabase
+from cache import CacheBackend, TTLCache
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from utils import verify_password
+from hashing import hash_pool
+from utils import credential_digest
 
 security = HTTPBasic()
 
+# (email, stored hash, password) digest -> user id, for credentials bcrypt already accepted
+credential_cache = TTLCache(maxsize=int(env.get("AUTH_CACHE_SIZE", 4096)),
+                            ttl=float(env.get("AUTH_CACHE_TTL", 300)))
 
-def get_db():
-    db = Database()
+
+# a PoolTimeout here, or later when a replica-routed request first needs the primary, becomes a 503 in main
+async def open_db(request: Request, session=None) -> AsyncDatabase:
+    db = AsyncDatabase(pool=request.app.state.pool, replicas=request.app.state.replicas, session=session)
+    await db.open()
+    return db
+
+
+# one unit of work per request: the handler's writes commit together after it returns,
+# and nothing is committed if it raises (HTTPException included). Always inject it with
+# Depends(get_db, scope="function"): that scope exits before the response is sent, so a
+# failed commit is an error response and a client never reads its success before the commit.
+# (The default request scope exits after the body; it is also part of the cache key, so a
+# mixed declaration would open a second unit of work.)
+async def get_db(request: Request):
+    db = await open_db(request)
 
     try:
-        db.open()
-        yield db
+        async with db.transaction():
+            yield db
     finally:
-        db.close()
+        await db.close()
+
 
+def get_response_cache(request: Request) -> CacheBackend:
+    return request.app.state.response_cache
 
-def validate_user(credentials: HTTPBasicCredentials = Depends(security), db: Database = Depends(get_db)):
-    user = db.get_one("users", ["id", "password", "active"], where={"email": credentials.username})
 
+async def _authenticate(db: AsyncDatabase, credentials: HTTPBasicCredentials) -> int:
+    user = await db.get_one("users", ["id", "password", "active"], where={"email": credentials.username})
+
+    # the lookup still runs on every call, so deactivated accounts and changed passwords miss the cache
     if user and user['active']:
-        if verify_password(credentials.password, user.get('password')):
+        key = credential_digest(credentials.username, user.get('password'), credentials.password)
+
+        if credential_cache.get(key) == user.get('id'):
+            return user.get('id')
+
+        if await hash_pool.verify(credentials.password, user.get('password')):
+            credential_cache.set(key, user.get('id'))
             return user.get('id')
 
     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                         detail="Invalid credentials or inactive account.",
                         headers={"WWW-Authenticate": "Basic"})
+
+
+async def validate_user(credentials: HTTPBasicCredentials = Depends(security),
+                        db: AsyncDatabase = Depends(get_db, scope="function")):
+    user_id = await _authenticate(db, credentials)
+    await db.bind(user_id)
+    return user_id
+
+
+# for handlers that manage their own connection (bulk loads, exports): the lookup's
+# connection is back in the pool before the handler runs, so they never hold two
+async def authenticate(request: Request, credentials: HTTPBasicCredentials = Depends(security)):
+    db = await open_db(request)
+
+    try:
+        return await _authenticate(db, credentials)
+    finally:
+        await db.close()
@@ -0,0 +1,112 @@
+"""Print the plan of every query shape the routers send, to check index use.
+
+    python explain_queries.py > before.txt
+    python migrate.py
+    python explain_queries.py > after.txt
+    diff before.txt after.txt
+
+Statements are built by the same QueryBuilder methods Database uses, with
+parameters taken from rows already in the database (run `python -m
+benchmarks seed` on an empty one first). Plans come from plain EXPLAIN;
+--analyze runs the statements inside a transaction that is rolled back,
+so the UPDATE, DELETE and upvote_message() shapes change nothing.
+"""
+import argparse
+import re
+from datetime import datetime
+from dotenv import load_dotenv
+from db import Database
+from records import Message, TopMessage
+
+# (route, method name, arguments); "{user}", "{email}", "{token}" and "{message}" are filled from the database.
+# One entry per statement the handlers send, with the same arguments: change it along with them.
+SHAPES = [
+    ("auth (every route)", "_get_query", ("users", ["id", "password", "active"], 1, {"email": "{email}"})),
+    ("POST /activate", "_get_query", ("tokens", ["user_id", "expires_at"], 1, {"token": "{token}"})),
+    ("POST /activate", "_get_query", ("users", ["active"], 1, {"id": "{user}"})),
+    ("POST /activate", "_update_query", ("users", ["active", "activated_at"], ["true", "now()"], {"id": "{user}"})),
+    ("POST /activate", "_delete_query", ("tokens", {"user_id": "{user}"})),
+    ("GET /messages/most_upvoted", "_get_query", ("guestbook", TopMessage.COLUMNS, 10, {"private": False}, None,
+                                                  None, ["upvote_count", "id"], True)),
+    ("POST /messages/{id}/upvote", "_call_query", ("upvote_message", ["{user}", "{message}"])),
+    ("POST /messages/{id}/upvote (write-behind)", "_get_query", ("guestbook", ["user_id", "private"], 1,
+                                                                 {"id": "{message}"})),
+    ("POST /messages/{id}/upvote (write-behind)", "_get_query", ("upvotes", ["id"], 1,
+                                                                 {"user_id": "{user}", "message_id": "{message}"})),
+    ("GET /messages", "_get_query", ("guestbook", ["id", "message", "created_at"], 11, {"private": False},
+                                     {"private": True, "user_id": "{user}"}, None, ["created_at", "id"], True)),
+    ("GET /messages?cursor=", "_get_query", ("guestbook", ["id", "message", "created_at"], 11, {"private": False},
+                                             {"private": True, "user_id": "{user}"}, None, ["created_at", "id"],
+                                             True, [datetime.now(), 2 ** 31 - 1])),
+    ("GET /messages/search", "_search_query", ("guestbook", ["id", "message", "private", "created_at"], "hello",
+                                               "search", "english", 11, {"private": False},
+                                               {"private": True, "user_id": "{user}"})),
+    ("GET /messages/search?cursor=", "_search_query", ("guestbook", ["id", "message", "private", "created_at"],
+                                                       "hello", "search", "english", 11, {"private": False},
+                                                       {"private": True, "user_id": "{user}"}, [1.0, 2 ** 31 - 1])),
+    ("GET /messages/export", "_get_query", ("guestbook", ["id", "message", "private", "created_at"], None,
+                                            {"private": False}, {"private": True, "user_id": "{user}"}, None,
+                                            ["created_at", "id"])),
+    ("GET /messages/{id}", "_get_query", ("guestbook", Message.COLUMNS + ["private"], 1,
+                                          {"id": "{message}", "private": False},
+                                          {"id": "{message}", "private": True, "user_id": "{user}"})),
+    ("PATCH|DELETE /messages/{id}", "_get_query", ("guestbook", ["id", "user_id"], 1, {"id": "{message}"})),
+    ("PATCH /messages/{id}", "_update_query", ("guestbook", ["message", "private"], ["edited", False],
+                                               {"id": "{message}"})),
+    ("DELETE /messages/{id}", "_delete_query", ("guestbook", {"id": "{message}"})),
+    ("DELETE /messages/{id} (upvotes cascade)", "_get_query", ("upvotes", ["id"], None, {"message_id": "{message}"})),
+]
+
+
+def samples(db):
+    user = db.get_one("users", ["id", "email"])
+    token = db.get_one("tokens", ["token"])
+    message = db.get_one("guestbook", ["id"])
+
+    if not (user and token and message):
+        raise SystemExit("Needs at least one user, token and message; seed the database first")
+
+    return {"{user}": user["id"], "{email}": user["email"], "{token}": token["token"], "{message}": message["id"]}
+
+
+def fill(value, values):
+    if isinstance(value, dict):
+        return {k: fill(v, values) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(fill(v, values) for v in value)
+    if isinstance(value, str):
+        return values.get(value, value)
+    return value
+
+
+def scans(plan: str):
+    return sorted(set(re.findall(r"((?:Parallel )?(?:Seq|Index|Index Only|Bitmap Heap|Bitmap Index) Scan"
+                                 r"(?: using \S+)? on \S+)", plan)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--analyze", action="store_true", help="EXPLAIN (ANALYZE, BUFFERS) instead of EXPLAIN")
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = Database()
+    db.open()
+
+    try:
+        values = samples(db)
+        explain = "EXPLAIN (ANALYZE, BUFFERS) " if args.analyze else "EXPLAIN "
+
+        for route, method, arguments in SHAPES:
+            query, params = getattr(Database, method)(*fill(arguments, values))
+            db.cursor.execute(explain + query, params)
+            plan = "\n".join(row["QUERY PLAN"] for row in db.cursor.fetchall())
+            db.conn.rollback()
+
+            print(f"== {route}\n{query}\n-- {'; '.join(scans(plan)) or 'no scans'}\n{plan}\n")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""bcrypt off the request path.
+
+Hashing and verification run in a small pool of worker processes, so a burst
+of /register calls or logins cannot starve the event loop or the threadpool
+that cheap endpoints rely on. At most HASH_QUEUE_LIMIT jobs may be queued or
+running; past that HashQueueFull is raised and the app answers 503.
+"""
+import asyncio
+from os import environ as env
+from time import time
+from fastapi.concurrency import run_in_threadpool
+import metrics
+from utils import get_password_hash, verify_password
+
+queue_wait = metrics.register(metrics.Histogram(
+    "guestbook_hash_queue_wait_seconds", "Time a bcrypt job waited for a worker process.", ["operation"]))
+hash_duration = metrics.register(metrics.Histogram(
+    "guestbook_hash_duration_seconds", "Time a bcrypt job ran in its worker process.", ["operation"]))
+rejected = metrics.register(metrics.Counter(
+    "guestbook_hash_rejected_total", "bcrypt jobs refused because the queue was full.", ["operation"]))
+
+
+class HashQueueFull(Exception):
+    pass
+
+
+def _timed(fn, submitted_at, *args):
+    # runs in the worker; wall-clock time because monotonic clocks do not compare across processes
+    started = time()
+    result = fn(*args)
+    return started - submitted_at, time() - started, result
+
+
+class HashingPool:
+    def __init__(self, workers: int = None, queue_limit: int = None):
+        self.workers = int(workers if workers is not None else env.get("HASH_WORKERS", 2))
+        self.queue_limit = int(queue_limit if queue_limit is not None else env.get("HASH_QUEUE_LIMIT", 64))
+        self.pending = 0
+        self._executor = None
+
+    def _get_executor(self):
+        # created on first use so importing this module never forks (nor imports
+        # multiprocessing); spawn avoids inheriting the event loop and open connections
+        if self._executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            from multiprocessing import get_context
+
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=get_context("spawn"))
+        return self._executor
+
+    async def _run(self, operation, fn, *args):
+        if self.pending >= self.queue_limit:
+            rejected.inc(operation)
+            raise HashQueueFull(f"{self.pending} {operation} jobs already queued")
+
+        self.pending += 1
+        try:
+            if not self.workers:
+                return await run_in_threadpool(fn, *args)
+
+            loop = asyncio.get_running_loop()
+            waited, ran, result = await loop.run_in_executor(self._get_executor(), _timed, fn, time(), *args)
+            queue_wait.observe(max(waited, 0.0), operation)
+            hash_duration.observe(ran, operation)
+            return result
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", verify_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+hash_pool = HashingPool()
@@ -0,0 +1,122 @@
+"""Streaming parsers for POST /messages/bulk bodies.
+
+Both yield (record_number, (message, private), error) tuples as bytes arrive,
+so a large upload is never held in memory at once. `error` is None for a
+valid record and a short reason otherwise.
+"""
+from csv import reader
+from json import JSONDecodeError, loads
+
+NDJSON = "application/x-ndjson"
+CSV = "text/csv"
+
+_TRUE = {"true", "t", "1", "yes", "y"}
+_FALSE = {"false", "f", "0", "no", "n", ""}
+
+
+# raw bytes: each record is decoded on its own, so invalid UTF-8 rejects just that record
+async def _lines(stream):
+    buffer = b""
+
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+
+        for line in lines:
+            yield line.rstrip(b"\r")
+
+    if buffer:
+        yield buffer.rstrip(b"\r")
+
+
+def _message(message, private):
+    if not isinstance(message, str) or not message.strip():
+        raise ValueError("message must be a non-empty string")
+
+    if isinstance(private, str):
+        if private.strip().lower() not in _TRUE | _FALSE:
+            raise ValueError(f"private must be a boolean, got {private!r}")
+        private = private.strip().lower() in _TRUE
+
+    if not isinstance(private, bool):
+        raise ValueError("private must be a boolean")
+
+    return message, private
+
+
+async def _ndjson(stream):
+    number = 0
+
+    async for line in _lines(stream):
+        if not line.strip():
+            continue
+
+        number += 1
+        try:
+            record = loads(line.decode())
+            if not isinstance(record, dict):
+                raise ValueError("expected a JSON object")
+
+            yield number, _message(record.get("message"), record.get("private", False)), None
+        except (JSONDecodeError, UnicodeDecodeError, ValueError) as e:
+            yield number, None, str(e)
+
+
+async def _csv_rows(stream):
+    # a quoted field may span lines: keep joining until the quotes balance. Counted on the
+    # bytes, where '"' never occurs inside a multi-byte character, so a record that turns out
+    # not to be UTF-8 still ends where it should
+    parts = []
+
+    async for line in _lines(stream):
+        parts.append(line)
+        record = b"\n".join(parts)
+
+        if record.count(b'"') % 2:
+            continue
+
+        parts = []
+        if record.strip():
+            try:
+                yield next(reader([record.decode()])), None
+            except UnicodeDecodeError as e:
+                yield None, str(e)
+
+    if parts:
+        # the body ended inside a quoted field: everything since its opening quote is one bad record
+        yield None, f"unterminated quoted field, {len(parts)} line(s) from its opening quote to the end"
+
+
+async def _csv(stream):
+    rows = _csv_rows(stream)
+    header, error = [], None
+
+    async for header, error in rows:
+        break
+
+    header = [column.strip().lower() for column in header or []]
+
+    if "message" not in header:
+        yield 0, None, error or "CSV header must include a message column"
+        return
+
+    number = 0
+    async for row, error in rows:
+        number += 1
+        if error:
+            yield number, None, error
+            continue
+
+        values = dict(zip(header, row))
+
+        try:
+            yield number, _message(values.get("message"), values.get("private", "")), None
+        except ValueError as e:
+            yield number, None, str(e)
+
+
+PARSERS = {NDJSON: _ndjson, CSV: _csv}
+
+
+def read_messages(stream, content_type: str):
+    return PARSERS[content_type](stream)
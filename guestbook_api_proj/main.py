@@ -1,11 +1,164 @@
-from fastapi import FastAPI
-from routers import accounts, messages
+from contextlib import asynccontextmanager
+from os import environ as env
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+from psycopg_pool import PoolTimeout
 
-app = FastAPI(
-    title="Guestbook API",
-    version="0.1.0",
-    description="A place to leave your suggestions..."
-)
+# The application modules read their settings from the environment when they are first
+# imported, so they are imported in create_app() after it has loaded .env, and where they
+# are used below.
 
-app.include_router(accounts.router)
-app.include_router(messages.router)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from async_db import create_pool, create_replica_router
+    from cache import LocalCache
+    from hashing import hash_pool
+    from purge import TokenPurger
+    from routers import messages
+    from upvotes import UpvoteBuffer, write_behind_enabled
+
+    # DB_POOL_MAX_SIZE=0 falls back to a new connection per request
+    app.state.pool = create_pool() if int(env.get("DB_POOL_MAX_SIZE", 10)) else None
+    # DB_REPLICA_URLS sends reads to replicas; needs the pool
+    app.state.replicas = create_replica_router() if app.state.pool else None
+    # swap in any cache.CacheBackend here (a shared store for multi-worker deployments)
+    app.state.response_cache = LocalCache(maxsize=int(env.get("RESPONSE_CACHE_SIZE", 1024)),
+                                          ttl=float(env.get("RESPONSE_CACHE_TTL", 30)))
+
+    if app.state.pool:
+        await app.state.pool.open(wait=True)
+
+    if app.state.replicas:
+        await app.state.replicas.open()
+
+    app.state.token_purger = TokenPurger(app.state.pool)
+    app.state.token_purger.start()
+
+    app.state.upvote_buffer = None
+    if write_behind_enabled():
+        app.state.upvote_buffer = UpvoteBuffer(app.state.pool, app.state.response_cache,
+                                               invalidate=(messages.MOST_UPVOTED_KEY,))
+        app.state.upvote_buffer.start()
+
+    yield
+
+    # flushes what is still buffered, so it goes before the pool closes
+    if app.state.upvote_buffer:
+        await app.state.upvote_buffer.stop()
+
+    await app.state.token_purger.stop()
+    hash_pool.shutdown()
+
+    if app.state.replicas:
+        await app.state.replicas.close()
+
+    if app.state.pool:
+        await app.state.pool.close()
+
+
+async def pool_timeout(request: Request, exc: PoolTimeout):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        content={"detail": "The server is busy, please try again shortly."},
+                        headers={"Retry-After": "1"})
+
+
+async def hash_queue_full(request: Request, exc: Exception):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        content={"detail": "Too many sign-ins in progress, please retry shortly."},
+                        headers={"Retry-After": "1"})
+
+
+async def health(request: Request):
+    from dependencies import credential_cache
+    from query import compile_cache_info
+    from slowlog import slow_queries
+
+    state = request.app.state
+    return {
+        "status": "ok",
+        "pool": state.pool.get_stats() if state.pool else None,
+        "replicas": state.replicas.get_stats() if state.replicas else None,
+        "auth_cache": credential_cache.get_stats(),
+        "query_cache": compile_cache_info(),
+        "slow_queries": slow_queries.get_stats(),
+        "response_cache": state.response_cache.get_stats(),
+        "rate_limits": state.rate_limits.get_stats(),
+        "admission": state.admission.get_stats(),
+    }
+
+
+async def metrics(request: Request):
+    from dependencies import credential_cache
+    from hashing import hash_pool
+    from metrics import render_metrics
+
+    state = request.app.state
+    gauges = {}
+
+    if state.pool:
+        gauges.update({f"guestbook_pool_{k}": v for k, v in state.pool.get_stats().items()})
+
+    if state.replicas:
+        stats = state.replicas.get_stats()
+        gauges.update({f"guestbook_replica_{k}": stats[k] for k in ("checkouts", "pinned", "fallbacks", "failures")})
+        gauges.update({f'guestbook_replica_in_use{{replica="{i}"}}': n for i, n in enumerate(stats["in_use"])})
+        gauges["guestbook_replicas_down"] = len(stats["down"])
+
+    gauges.update({f"guestbook_response_cache_{k}": v for k, v in state.response_cache.get_stats().items()})
+    gauges.update({f"guestbook_auth_cache_{k}": v for k, v in credential_cache.get_stats().items()})
+    gauges["guestbook_hash_pending"] = hash_pool.pending
+
+    if state.upvote_buffer:
+        gauges["guestbook_upvotes_pending"] = len(state.upvote_buffer.pending)
+    gauges.update({f"guestbook_admission_{k}": v for k, v in state.admission.get_stats().items()})
+    gauges.update({f"guestbook_rate_limit_{k}": v for k, v in state.rate_limits.get_stats().items()})
+
+    return PlainTextResponse(render_metrics(gauges), media_type="text/plain; version=0.0.4")
+
+
+def create_app() -> FastAPI:
+    """Build the application.
+
+    Loads .env, the only place the API does. Nothing expensive happens here:
+    connection pools are opened by the lifespan, the bcrypt worker processes and
+    passlib on the first sign-in. Each call returns an independent app with its
+    own limiters, e.g. one per test.
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    from hashing import HashQueueFull
+    from metrics import MetricsMiddleware
+    from ratelimit import ConcurrencyLimiter, LocalRateLimiter, RateLimitMiddleware
+    from routers import accounts, messages
+
+    app = FastAPI(
+        title="Guestbook API",
+        version="0.1.0",
+        description="A place to leave your suggestions...",
+        lifespan=lifespan
+    )
+
+    # swap in a shared ratelimit.RateLimitBackend to enforce limits across worker processes
+    app.state.rate_limits = LocalRateLimiter()
+    app.state.admission = ConcurrencyLimiter()
+
+    # added first so it runs inside MetricsMiddleware, which then also counts refused requests
+    app.add_middleware(RateLimitMiddleware, backend=app.state.rate_limits, concurrency=app.state.admission)
+    app.add_middleware(MetricsMiddleware)
+
+    app.add_exception_handler(PoolTimeout, pool_timeout)
+    app.add_exception_handler(HashQueueFull, hash_queue_full)
+
+    app.include_router(accounts.router)
+    app.include_router(messages.router)
+
+    app.add_api_route("/health", health, include_in_schema=False)
+    app.add_api_route("/metrics", metrics, include_in_schema=False, response_class=PlainTextResponse)
+
+    return app
+
+
+# for `uvicorn main:app`; `uvicorn --factory main:create_app` builds it on demand instead
+app = create_app()
@@ -0,0 +1,199 @@
+"""Request and query instrumentation, rendered in the Prometheus text format.
+
+Database classes report every statement through record_query(); the
+MetricsMiddleware collects them per request into a Server-Timing header,
+a slow-request log line and the histograms served by GET /metrics.
+Set METRICS_ENABLED=0 to skip all of it.
+"""
+import logging
+import re
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import lru_cache
+from os import environ as env
+from threading import Lock
+from time import perf_counter
+
+ENABLED = env.get("METRICS_ENABLED", "1") != "0"
+SLOW_REQUEST_MS = float(env.get("SLOW_REQUEST_MS", 500))
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+slow_log = logging.getLogger("guestbook.slow")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, "+Inf"), series):
+                    cumulative += count
+                    le = _labels(self.labelnames, labels, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+request_duration = register(Histogram("guestbook_request_duration_seconds", "Request latency by route.",
+                                      ["method", "route", "status"]))
+request_queries = register(Counter("guestbook_request_queries_total", "Statements issued, by route.",
+                                   ["method", "route"]))
+query_duration = register(Histogram("guestbook_query_duration_seconds", "Statement latency by query shape.",
+                                    ["shape"]))
+query_rows = register(Counter("guestbook_query_rows_total", "Rows returned or affected, by query shape.",
+                              ["shape"]))
+
+
+def render_metrics(gauges: dict = None):
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+
+    typed = set()
+    for name, value in (gauges or {}).items():
+        # labelled gauges ("name{label=...}") share one TYPE line
+        base = name.split("{", 1)[0]
+        if base not in typed:
+            typed.add(base)
+            lines.append(f"# TYPE {base} gauge")
+        lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time", "shapes")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.shapes = {}  # shape -> seconds
+
+
+current_request: ContextVar = ContextVar("current_request", default=None)
+
+
+# a repeated VALUES row, as written by compile_write() for multi-row inserts
+_REPEATED_ROWS = re.compile(r"(\((?:%s,)*%s\))(?:,\1)+")
+
+
+@lru_cache(maxsize=1024)
+def query_shape(statement: str) -> str:
+    # one label per multi-row INSERT however many rows it carried, rather than one per chunk
+    # length, each several KB long
+    return _REPEATED_ROWS.sub(r"\1,...", statement)
+
+
+def record_query(statement: str, duration: float, rows: int):
+    shape = query_shape(statement)
+    query_duration.observe(duration, shape)
+    if rows and rows > 0:
+        query_rows.inc(shape, amount=rows)
+
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += duration
+        stats.shapes[shape] = stats.shapes.get(shape, 0.0) + duration
+
+
+class MetricsMiddleware:
+    """ASGI middleware: per-request Server-Timing, slow-request log and route histograms."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not ENABLED or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timing = (f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+                          f'app;dur={(perf_counter() - start) * 1000:.1f}')
+                message.setdefault("headers", []).append((b"server-timing", timing.encode()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_request.reset(token)
+            duration = perf_counter() - start
+            route = getattr(scope.get("route"), "path", "unmatched")
+
+            request_duration.observe(duration, scope["method"], route, status)
+            request_queries.inc(scope["method"], route, amount=stats.queries)
+
+            if duration * 1000 >= SLOW_REQUEST_MS:
+                slowest = sorted(stats.shapes.items(), key=lambda item: -item[1])[:3]
+                slow_log.warning("%s %s -> %s in %.1fms (%d queries, %.1fms in db); slowest: %s",
+                                 scope["method"], scope["path"], status, duration * 1000,
+                                 stats.queries, stats.db_time * 1000,
+                                 "; ".join(f"{s!r} {t * 1000:.1f}ms" for s, t in slowest))
@@ -0,0 +1,151 @@
+"""Apply the SQL files in migrations/ that this database has not seen yet.
+
+    python migrate.py            # apply pending migrations in version order
+    python migrate.py --status   # list applied and pending versions
+
+Each file is named NNN_description.sql and is applied at most once; applied
+versions are recorded in schema_migrations. A file runs in one transaction
+together with its bookkeeping row, so it either applies completely or not
+at all. Files whose first line is `-- migrate: no-transaction` run statement
+by statement in autocommit mode instead, which CREATE INDEX CONCURRENTLY
+requires; such files must be idempotent (`if not exists`) and must not
+contain function bodies, since they are split on semicolons.
+
+A fresh database built from DDL.sql already has every migration's effect;
+running this against it records the versions and changes nothing.
+"""
+import argparse
+import re
+import sys
+from os import environ as env
+from pathlib import Path
+from dotenv import load_dotenv
+from psycopg2 import connect, Error as DatabaseError
+
+load_dotenv()
+
+MIGRATIONS = Path(__file__).resolve().parent / "migrations"
+NO_TRANSACTION = "-- migrate: no-transaction"
+# any value, as long as every runner uses the same one
+LOCK_ID = 7_351_262
+
+CREATE_TABLE = """
+create table if not exists schema_migrations
+(
+    version    text PRIMARY KEY,
+    name       text      NOT NULL,
+    applied_at timestamp NOT NULL DEFAULT current_timestamp
+)
+"""
+
+
+def migrations(directory=MIGRATIONS):
+    found = []
+    for path in sorted(directory.glob("*.sql")):
+        match = re.fullmatch(r"(\d+)_(.+)\.sql", path.name)
+        if match:
+            found.append((match.group(1), match.group(2), path))
+    return found
+
+
+def statements(sql: str):
+    body = "\n".join(line for line in sql.splitlines() if not line.lstrip().startswith("--"))
+    return [statement.strip() for statement in body.split(";") if statement.strip()]
+
+
+CREATE_INDEX = re.compile(r'create\s+(?:unique\s+)?index\s+(?:concurrently\s+)?(?:if\s+not\s+exists\s+)?("(?:[^"]|"")+"|\w+)',
+                          re.IGNORECASE)
+
+
+def index_names(statements) -> list[str]:
+    # as stored in pg_class: unquoted names fold to lower case
+    names = [match.group(1) for statement in statements if (match := CREATE_INDEX.match(statement))]
+    return [name[1:-1].replace('""', '"') if name.startswith('"') else name.lower() for name in names]
+
+
+def applied(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def drop_invalid_indexes(cursor, names):
+    # an interrupted CREATE INDEX CONCURRENTLY leaves an INVALID index behind, which
+    # `if not exists` would then silently keep; drop it so the retry builds it again. Only the
+    # file's own indexes: any other invalid one may be a build still running in another session
+    if not names:
+        return
+
+    cursor.execute("""
+        SELECT quote_ident(n.nspname) || '.' || quote_ident(c.relname)
+        FROM pg_index i
+                 JOIN pg_class c ON c.oid = i.indexrelid
+                 JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE NOT i.indisvalid
+          AND n.nspname = current_schema()
+          AND c.relname = ANY (%s)
+    """, (names,))
+    for (index,) in cursor.fetchall():
+        print(f"  dropping invalid index {index}")
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index}")
+
+
+def apply(conn, version, name, path):
+    sql = path.read_text()
+
+    with conn.cursor() as cursor:
+        if sql.startswith(NO_TRANSACTION):
+            conn.autocommit = True
+            try:
+                drop_invalid_indexes(cursor, index_names(statements(sql)))
+                for statement in statements(sql):
+                    cursor.execute(statement)
+                cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            finally:
+                conn.autocommit = False
+        else:
+            try:
+                cursor.execute(sql)
+                cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                conn.commit()
+            except DatabaseError:
+                conn.rollback()
+                raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="list versions instead of applying them")
+    args = parser.parse_args()
+
+    conn = connect(env.get("CONNECTION_URL"))
+    conn.autocommit = True
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(CREATE_TABLE)
+            # one runner at a time, e.g. when several app instances migrate on deploy
+            cursor.execute("SELECT pg_advisory_lock(%s)", (LOCK_ID,))
+            done = applied(cursor)
+        conn.autocommit = False
+
+        pending = [m for m in migrations() if m[0] not in done]
+
+        if args.status:
+            for version, name, _ in migrations():
+                print(f"{version} {name:<40} {'applied' if version in done else 'pending'}")
+            return
+
+        for version, name, path in pending:
+            print(f"applying {version} {name}")
+            try:
+                apply(conn, version, name, path)
+            except DatabaseError as e:
+                sys.exit(f"{version} {name} failed, later migrations were not applied:\n{e}")
+
+        print(f"{len(pending)} migration(s) applied" if pending else "up to date")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
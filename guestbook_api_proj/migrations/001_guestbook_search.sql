@@ -0,0 +1,7 @@
+-- full-text search for GET /messages/search
+-- the generated column is recomputed by postgres whenever message is inserted or updated
+alter table guestbook
+    add column if not exists search tsvector
+        generated always as (to_tsvector('english', message)) stored;
+
+create index if not exists guestbook_search_idx on guestbook using gin (search);
@@ -0,0 +1,55 @@
+-- denormalized per-message upvote counter replacing the top_messages view
+alter table guestbook add column if not exists upvote_count integer not null default 0;
+
+create or replace function guestbook_count_upvote() returns trigger
+    language plpgsql as
+$$
+begin
+    if tg_op = 'INSERT' then
+        update guestbook set upvote_count = upvote_count + 1 where id = new.message_id;
+    else
+        -- also fires for upvotes cascading from a deleted message, where this matches nothing
+        update guestbook set upvote_count = upvote_count - 1 where id = old.message_id;
+    end if;
+
+    return null;
+end
+$$;
+
+drop trigger if exists upvotes_count on upvotes;
+create trigger upvotes_count
+    after insert or delete
+    on upvotes
+    for each row
+execute function guestbook_count_upvote();
+
+-- recomputes every counter from upvotes, returns how many were wrong
+create or replace function repair_upvote_counts() returns integer
+    language plpgsql as
+$$
+declare
+    fixed integer;
+begin
+    -- block new upvotes until the recount commits so none is lost in between
+    lock table upvotes in share mode;
+
+    with actual as (select g.id, count(u.id)::integer as n
+                    from guestbook as g
+                             left join upvotes u on g.id = u.message_id
+                    group by g.id)
+    update guestbook as g
+    set upvote_count = a.n
+    from actual as a
+    where g.id = a.id
+      and g.upvote_count <> a.n;
+
+    get diagnostics fixed = row_count;
+    return fixed;
+end
+$$;
+
+select repair_upvote_counts();
+
+create index if not exists guestbook_top_upvoted_idx on guestbook (private, upvote_count desc, id desc);
+
+drop view if exists top_messages;
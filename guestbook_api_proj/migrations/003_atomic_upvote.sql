@@ -0,0 +1,47 @@
+-- one upvote per user and message, enforced by the database
+delete
+from upvotes as u
+    using upvotes as earlier
+where u.user_id = earlier.user_id
+  and u.message_id = earlier.message_id
+  and u.id > earlier.id;
+
+do
+$$
+    begin
+        if not exists (select 1 from pg_constraint where conname = 'upvotes_user_message_key') then
+            alter table upvotes add constraint upvotes_user_message_key unique (user_id, message_id);
+        end if;
+    end
+$$;
+
+-- the whole POST /messages/{id}/upvote decision in one round trip.
+-- returns 'upvoted', 'not_found' (missing, or someone else's private message),
+-- 'own_message' or 'duplicate'
+create or replace function upvote_message(voter integer, target integer) returns text
+    language plpgsql as
+$$
+declare
+    author     integer;
+    is_private boolean;
+begin
+    -- key share keeps the message from being deleted under us without blocking the counter update
+    select user_id, private into author, is_private from guestbook where id = target for key share;
+
+    if not found or (is_private and author <> voter) then
+        return 'not_found';
+    end if;
+
+    if author = voter then
+        return 'own_message';
+    end if;
+
+    insert into upvotes (user_id, message_id) values (voter, target) on conflict (user_id, message_id) do nothing;
+
+    if not found then
+        return 'duplicate';
+    end if;
+
+    return 'upvoted';
+end
+$$;
@@ -0,0 +1,16 @@
+-- migrate: no-transaction
+-- built CONCURRENTLY so writers are not blocked while the indexes build on a live table;
+-- (user_id, message_id) is already covered by upvotes_user_message_key
+
+-- POST /activate looks the token up by value
+create index concurrently if not exists tokens_token_idx on tokens (token);
+
+-- keyset pagination over (created_at, id): GET /messages and export
+create index concurrently if not exists guestbook_created_at_id_idx on guestbook (created_at, id);
+
+-- the caller's own private messages: GET /messages, search and export (or_where private and user_id),
+-- and the cascade when a user is deleted
+create index concurrently if not exists guestbook_user_id_private_idx on guestbook (user_id, private);
+
+-- the cascade when a message is deleted, and repair_upvote_counts()
+create index concurrently if not exists upvotes_message_id_idx on upvotes (message_id);
@@ -0,0 +1,27 @@
+-- activation tokens expire; tokens issued before this migration get two days from now
+alter table tokens
+    add column if not exists expires_at timestamptz not null default current_timestamp + interval '2 days';
+
+create index if not exists tokens_expires_at_idx on tokens (expires_at);
+-- /activate deletes a user's tokens, and deleting a user cascades here
+create index if not exists tokens_user_id_idx on tokens (user_id);
+
+-- deletes at most batch_size expired tokens and returns how many it removed.
+-- skip locked lets several app instances purge side by side without waiting on each other
+create or replace function purge_expired_tokens(batch_size integer) returns integer
+    language plpgsql as
+$$
+declare
+    purged integer;
+begin
+    delete
+    from tokens
+    where id in (select id
+                 from tokens
+                 where expires_at < current_timestamp
+                 limit batch_size for update skip locked);
+
+    get diagnostics purged = row_count;
+    return purged;
+end
+$$;
@@ -0,0 +1,62 @@
+-- counters move once per statement instead of once per row, so a batch of upvotes
+-- for one message is a single update of its guestbook row
+create or replace function guestbook_count_upvote() returns trigger
+    language plpgsql as
+$$
+begin
+    if tg_op = 'INSERT' then
+        update guestbook as g
+        set upvote_count = g.upvote_count + c.n
+        from (select message_id, count(*)::integer as n from inserted group by message_id) as c
+        where g.id = c.message_id;
+    else
+        -- also fires for upvotes cascading from a deleted message, where this matches nothing
+        update guestbook as g
+        set upvote_count = g.upvote_count - c.n
+        from (select message_id, count(*)::integer as n from deleted group by message_id) as c
+        where g.id = c.message_id;
+    end if;
+
+    return null;
+end
+$$;
+
+-- transition tables need one trigger per event
+drop trigger if exists upvotes_count on upvotes;
+drop trigger if exists upvotes_count_insert on upvotes;
+create trigger upvotes_count_insert
+    after insert
+    on upvotes
+    referencing new table as inserted
+    for each statement
+execute function guestbook_count_upvote();
+
+drop trigger if exists upvotes_count_delete on upvotes;
+create trigger upvotes_count_delete
+    after delete
+    on upvotes
+    referencing old table as deleted
+    for each statement
+execute function guestbook_count_upvote();
+
+-- flush of the write-behind upvote buffer: inserts (voters[i], targets[i]) pairs in one statement,
+-- skipping duplicates, the voter's own messages and messages deleted or made private since they
+-- were accepted. returns how many were inserted
+create or replace function add_upvotes(voters integer[], targets integer[]) returns integer
+    language plpgsql as
+$$
+declare
+    added integer;
+begin
+    insert into upvotes (user_id, message_id)
+    select v.voter, v.target
+    from unnest(voters, targets) as v(voter, target)
+             join guestbook as g on g.id = v.target
+    where g.user_id <> v.voter
+      and not g.private
+    on conflict (user_id, message_id) do nothing;
+
+    get diagnostics added = row_count;
+    return added;
+end
+$$;
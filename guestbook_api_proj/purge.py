@@ -0,0 +1,85 @@
+"""Background removal of expired activation tokens.
+
+TokenPurger runs inside the app (started from the lifespan in main.py).
+Every TOKEN_PURGE_INTERVAL seconds it deletes expired tokens in batches of
+TOKEN_PURGE_BATCH_SIZE, each its own short transaction, sleeping
+TOKEN_PURGE_PAUSE seconds between batches so purging never holds locks for
+long or crowds out request traffic. At most TOKEN_PURGE_MAX_BATCHES run per
+pass; whatever is left waits for the next one.
+"""
+import asyncio
+import logging
+from os import environ as env
+from time import perf_counter
+from psycopg import Error as DatabaseError
+from async_db import AsyncDatabase
+import metrics
+
+log = logging.getLogger("guestbook.purge")
+
+purged_rows = metrics.register(metrics.Counter(
+    "guestbook_tokens_purged_total", "Expired activation tokens deleted by the background purge."))
+batch_duration = metrics.register(metrics.Histogram(
+    "guestbook_token_purge_batch_seconds", "Time one purge batch took, including its commit."))
+failures = metrics.register(metrics.Counter(
+    "guestbook_token_purge_failures_total", "Purge passes that ended with a database error."))
+
+
+class TokenPurger:
+    def __init__(self, pool=None, interval: float = None, batch_size: int = None, pause: float = None,
+                 max_batches: int = None):
+        self.pool = pool
+        self.interval = float(interval if interval is not None else env.get("TOKEN_PURGE_INTERVAL", 300))
+        self.batch_size = int(batch_size if batch_size is not None else env.get("TOKEN_PURGE_BATCH_SIZE", 1000))
+        self.pause = float(pause if pause is not None else env.get("TOKEN_PURGE_PAUSE", 0.1))
+        self.max_batches = int(max_batches if max_batches is not None else env.get("TOKEN_PURGE_MAX_BATCHES", 100))
+        self._task = None
+
+    async def purge(self) -> int:
+        """One pass: delete expired tokens batch by batch until none are left or max_batches ran."""
+        db = AsyncDatabase(pool=self.pool)
+        await db.open()
+        total = 0
+
+        try:
+            for _ in range(self.max_batches):
+                start = perf_counter()
+                purged = await db.call("purge_expired_tokens", [self.batch_size])
+                batch_duration.observe(perf_counter() - start)
+                purged_rows.inc(amount=purged)
+                total += purged
+
+                if purged < self.batch_size:
+                    break
+
+                await asyncio.sleep(self.pause)
+        finally:
+            await db.close()
+
+        return total
+
+    async def _run(self):
+        while True:
+            try:
+                purged = await self.purge()
+                if purged:
+                    log.info("purged %d expired activation token(s)", purged)
+            except (DatabaseError, OSError):
+                failures.inc()
+                log.exception("token purge failed, retrying in %ss", self.interval)
+
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        # TOKEN_PURGE_INTERVAL=0 turns the scheduler off (e.g. when a cron job calls purge_expired_tokens)
+        if self.interval and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="token-purge")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,206 @@
+"""Statement text for db.Database and async_db.AsyncDatabase.
+
+Imports no driver, so the API can use it without loading psycopg2.
+"""
+from functools import lru_cache
+from itertools import chain, islice
+from os import environ as env
+
+
+def quote_ident(name: str) -> str:
+    # doubled quotes per SQL, doubled % so the name survives placeholder parsing
+    return '"' + name.replace('"', '""').replace('%', '%%') + '"'
+
+
+def _join_idents(names, separator=","):
+    return separator.join(map(quote_ident, names))
+
+
+def _kv_and(keys, separator=" AND "):
+    return separator.join(f"{quote_ident(k)} = %s" for k in keys)
+
+
+def _where_or(where_keys, or_where_keys):
+    if or_where_keys:
+        return f"(({_kv_and(where_keys)}) OR ({_kv_and(or_where_keys)}))"
+
+    return f"({_kv_and(where_keys)})"
+
+
+# statement text is cached per shape; values are always bound as parameters so
+# PostgreSQL sees (and can prepare) the same text for every call of that shape
+compile_cache = lru_cache(maxsize=int(env.get("DB_QUERY_CACHE_SIZE", 256)))
+
+
+@compile_cache
+def compile_write(table, columns, row_count=1):
+    row = "({})".format(",".join(["%s"] * len(columns)))
+    return "INSERT INTO {} ({}) VALUES {} RETURNING id".format(
+        quote_ident(table), _join_idents(columns), ",".join([row] * row_count)
+    )
+
+
+@compile_cache
+def compile_get(table, columns, where_keys, or_where_keys, contains_keys, has_limit,
+                order_by=(), descending=False, has_after=False):
+    query = f"SELECT {_join_idents(columns)} FROM {quote_ident(table)}"
+    conditions = []
+
+    if contains_keys:
+        conditions.append("({})".format(" OR ".join(f"{quote_ident(k)} LIKE %s" for k in contains_keys)))
+
+    if where_keys:
+        conditions.append(_where_or(where_keys, or_where_keys))
+
+    # keyset pagination: resume strictly past the `after` row in order_by order
+    if has_after:
+        conditions.append("({}) {} ({})".format(
+            _join_idents(order_by), "<" if descending else ">", ",".join(["%s"] * len(order_by))
+        ))
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    if order_by:
+        direction = " DESC" if descending else ""
+        query += " ORDER BY " + ",".join(quote_ident(k) + direction for k in order_by)
+
+    if has_limit:
+        query += " LIMIT %s"
+
+    return query
+
+
+@compile_cache
+def compile_search(table, columns, vector, where_keys, or_where_keys, has_after, has_limit):
+    # best matches first, id as the tie-breaker so (rank, id) can serve as a keyset. ts_rank() is a
+    # real: cast to float8 once, so the rank handed back as the cursor compares equal to itself
+    rank = f"ts_rank({quote_ident(vector)}, tsq)::float8"
+    query = (f"SELECT {_join_idents(columns)}, {rank} AS rank "
+             f"FROM {quote_ident(table)}, websearch_to_tsquery(%s::regconfig, %s) AS tsq")
+    conditions = [f"{quote_ident(vector)} @@ tsq"]
+
+    if where_keys:
+        conditions.append(_where_or(where_keys, or_where_keys))
+
+    if has_after:
+        conditions.append(f'({rank},"id") < (%s,%s)')
+
+    query += " WHERE " + " AND ".join(conditions) + ' ORDER BY rank DESC,"id" DESC'
+
+    if has_limit:
+        query += " LIMIT %s"
+
+    return query
+
+
+@compile_cache
+def compile_call(function, arg_count):
+    return "SELECT {}({}) AS result".format(quote_ident(function), ",".join(["%s"] * arg_count))
+
+
+@compile_cache
+def compile_update(table, columns, where_keys):
+    query = f"UPDATE {quote_ident(table)} SET {_kv_and(columns, separator=',')}"
+
+    if where_keys:
+        query += f" WHERE {_kv_and(where_keys)}"
+
+    return query
+
+
+@compile_cache
+def compile_delete(table, where_keys):
+    query = f"DELETE FROM {quote_ident(table)}"
+
+    if where_keys:
+        query += f" WHERE {_kv_and(where_keys)}"
+
+    return query
+
+
+def compile_cache_info():
+    return {f.__name__: f.cache_info()._asdict()
+            for f in (compile_write, compile_get, compile_search, compile_call, compile_update, compile_delete)}
+
+
+class QueryBuilder:
+    """Turns the Database surface into (statement, params) pairs.
+
+    Shared by the sync Database and the async AsyncDatabase. Both drivers use
+    the same %s placeholder style.
+    """
+
+    @staticmethod
+    def _write_query(table, columns, data):
+        return compile_write(table, tuple(columns)), tuple(data)
+
+    @staticmethod
+    def _write_many_queries(table, columns, rows, chunk_size=None):
+        # one multi-row INSERT per chunk; full chunks all share a single cached shape
+        chunk_size = chunk_size or int(env.get("DB_WRITE_MANY_CHUNK", 500))
+        rows = iter(rows)
+
+        while chunk := list(islice(rows, chunk_size)):
+            yield compile_write(table, tuple(columns), len(chunk)), tuple(chain.from_iterable(chunk))
+
+    @staticmethod
+    def _get_query(table, columns, limit=None, where=None, or_where=None, contains=None,
+                   order_by=None, descending=False, after=None):
+        if after and not order_by:
+            raise ValueError("`after` needs an `order_by` to page over")
+
+        where = where or {}
+        # or_where only ever widens a where, matching the original composition
+        or_where = (or_where or {}) if where else {}
+        contains = contains or {}
+
+        query = compile_get(table, tuple(columns), tuple(where), tuple(or_where), tuple(contains), bool(limit),
+                            tuple(order_by or ()), descending, bool(after))
+        params = [f"%{v}%" for v in contains.values()]
+        params += where.values()
+        params += or_where.values()
+
+        if after:
+            params += after
+
+        if limit:
+            params.append(limit)
+
+        return query, tuple(params)
+
+    # ...WHERE col1 like '%search%' OR col2 like '%search%'
+    @classmethod
+    def _get_contains_query(cls, table, columns, search, limit=None):
+        return cls._get_query(table, columns, limit, contains={k: search for k in columns})
+
+    @staticmethod
+    def _search_query(table, columns, terms, vector="search", language="english", limit=None,
+                      where=None, or_where=None, after=None):
+        where = where or {}
+        or_where = (or_where or {}) if where else {}
+
+        query = compile_search(table, tuple(columns), vector, tuple(where), tuple(or_where), bool(after), bool(limit))
+        params = [language, terms, *where.values(), *or_where.values()]
+
+        if after:
+            params += after
+
+        if limit:
+            params.append(limit)
+
+        return query, tuple(params)
+
+    @staticmethod
+    def _call_query(function, args=()):
+        return compile_call(function, len(args)), tuple(args)
+
+    @staticmethod
+    def _update_query(table, columns, data, where=None):
+        where = where or {}
+        return compile_update(table, tuple(columns), tuple(where)), (*data, *where.values())
+
+    @staticmethod
+    def _delete_query(table, where=None):
+        where = where or {}
+        return compile_delete(table, tuple(where)), tuple(where.values())
@@ -0,0 +1,217 @@
+"""Admission control: per-client rate limits and a global concurrency cap.
+
+RateLimitMiddleware sorts every request into a route class (auth, search,
+write, read) and charges one token from two buckets: the caller's bucket
+for that class, and a per-IP bucket shared by all classes. The caller is
+the Authorization header when there is one, otherwise the client IP. An
+empty bucket gets 429 with Retry-After.
+
+Requests that pass are then admitted by ConcurrencyLimiter. At most
+MAX_CONCURRENT_REQUESTS run at once. Others wait up to ADMISSION_TIMEOUT
+seconds for a slot and otherwise get 503, well before they would queue on
+the database pool.
+
+Limits are "rate/burst" (tokens per second / bucket size) and can be
+changed per class with RATE_LIMIT_AUTH, RATE_LIMIT_SEARCH,
+RATE_LIMIT_WRITE, RATE_LIMIT_READ and RATE_LIMIT_IP; "0" turns a limit
+off and RATE_LIMIT_ENABLED=0 turns off all of them.
+"""
+import asyncio
+import json
+import re
+from collections import OrderedDict, namedtuple
+from hashlib import blake2b
+from math import ceil
+from os import environ as env
+from threading import Lock
+from time import monotonic
+import metrics
+
+Limit = namedtuple("Limit", ["rate", "burst"])
+
+DEFAULT_LIMITS = {
+    "auth": "0.2/5",  # /register and /activate: bcrypt and signups
+    "search": "2/10",  # full-text search and exports
+    "write": "5/20",
+    "read": "20/50",
+    "ip": "50/100",  # everything from one address, whoever it authenticates as
+}
+
+# (methods, path pattern, class), first match wins; unmatched paths are not limited
+ROUTE_CLASSES = [
+    ({"POST"}, re.compile(r"/(register|activate)"), "auth"),
+    ({"GET"}, re.compile(r"/messages/(search|export)"), "search"),
+    ({"POST", "PUT", "PATCH", "DELETE"}, re.compile(r"/messages.*"), "write"),
+    ({"GET", "HEAD"}, re.compile(r"/messages.*"), "read"),
+]
+
+shed = metrics.register(metrics.Counter(
+    "guestbook_requests_shed_total", "Requests refused by admission control.", ["reason", "route_class"]))
+
+
+def parse_limit(value: str):
+    rate, _, burst = value.partition("/")
+    if not float(rate):
+        return None
+    return Limit(float(rate), float(burst or rate))
+
+
+def configured_limits() -> dict:
+    if env.get("RATE_LIMIT_ENABLED", "1") == "0":
+        return {}
+
+    limits = {name: parse_limit(env.get(f"RATE_LIMIT_{name.upper()}", default))
+              for name, default in DEFAULT_LIMITS.items()}
+    return {name: limit for name, limit in limits.items() if limit}
+
+
+def route_class(method: str, path: str):
+    for methods, pattern, name in ROUTE_CLASSES:
+        if method in methods and pattern.fullmatch(path):
+            return name
+
+
+class RateLimitBackend:
+    """Where token buckets live.
+
+    Async so that a store shared by all workers (e.g. redis) can implement it;
+    with the local backend each worker process enforces the limits on its own.
+    """
+
+    async def take(self, key: str, limit: Limit, cost: float = 1) -> float:
+        """Take `cost` tokens from the bucket `key`.
+
+        Returns 0 when they were taken, otherwise the seconds until they would be available.
+        """
+        raise NotImplementedError
+
+    def get_stats(self) -> dict:
+        return {}
+
+
+class LocalRateLimiter(RateLimitBackend):
+    """Token buckets in this process's memory; the least recently used are dropped past `maxsize`."""
+
+    def __init__(self, maxsize: int = None):
+        self.maxsize = int(maxsize if maxsize is not None else env.get("RATE_LIMIT_MAX_KEYS", 100_000))
+        self.allowed = 0
+        self.limited = 0
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = Lock()
+
+    async def take(self, key: str, limit: Limit, cost: float = 1) -> float:
+        now = monotonic()
+
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+                self.allowed += 1
+            else:
+                wait = (cost - tokens) / limit.rate
+                self.limited += 1
+
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+
+        return wait
+
+    def get_stats(self):
+        with self._lock:
+            return {"keys": len(self._buckets), "allowed": self.allowed, "limited": self.limited}
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int = None, timeout: float = None):
+        pool_size = int(env.get("DB_POOL_MAX_SIZE", 10)) or 10
+        self.limit = int(limit if limit is not None else env.get("MAX_CONCURRENT_REQUESTS", 2 * pool_size))
+        self.timeout = float(timeout if timeout is not None else env.get("ADMISSION_TIMEOUT", 1))
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(self.limit)
+
+    async def acquire(self) -> bool:
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def get_stats(self):
+        return {"limit": self.limit, "in_flight": self.in_flight, "waiting": self.waiting}
+
+
+def _client_ip(scope, headers) -> str:
+    # only trust X-Forwarded-For behind a proxy that sets it (RATE_LIMIT_TRUST_PROXY=1)
+    forwarded = headers.get(b"x-forwarded-for")
+    if forwarded and env.get("RATE_LIMIT_TRUST_PROXY", "0") == "1":
+        return forwarded.decode("latin-1").split(",")[0].strip()
+    return (scope.get("client") or ("unknown",))[0]
+
+
+def _caller(headers, ip: str) -> str:
+    # the credentials are hashed, never stored; a wrong password is a different caller,
+    # so guessing someone's email cannot drain their bucket (the per-IP bucket still applies)
+    authorization = headers.get(b"authorization")
+    if authorization:
+        return "auth:" + blake2b(authorization, digest_size=16).hexdigest()
+    return "ip:" + ip
+
+
+async def _refuse(send, status: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode()),
+                            (b"retry-after", str(max(1, ceil(retry_after))).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, backend: RateLimitBackend = None, concurrency: ConcurrencyLimiter = None,
+                 limits: dict = None):
+        self.app = app
+        self.backend = backend or LocalRateLimiter()
+        self.concurrency = concurrency or ConcurrencyLimiter()
+        self.limits = limits if limits is not None else configured_limits()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        name = route_class(scope["method"], scope["path"])
+        if name is None:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        ip = _client_ip(scope, headers)
+        buckets = [(f"{name}:{_caller(headers, ip)}", self.limits.get(name)), (f"ip:{ip}", self.limits.get("ip"))]
+
+        for key, limit in buckets:
+            if limit:
+                wait = await self.backend.take(key, limit)
+                if wait:
+                    shed.inc("rate_limit", name)
+                    return await _refuse(send, 429, "Too many requests, slow down.", wait)
+
+        if not await self.concurrency.acquire():
+            shed.inc("overloaded", name)
+            return await _refuse(send, 503, "The server is busy, please try again shortly.", 1)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.concurrency.release()
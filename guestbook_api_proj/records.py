@@ -0,0 +1,29 @@
+"""Row types for values that are cached between requests.
+
+Pass one as `record=` to a Database read and rows come back as instances
+built positionally from the selected columns (so field order must match
+COLUMNS), without a dict per row. They are frozen because cached values
+are shared between requests, and slotted to keep the cache small;
+responses.dumps serializes them directly. Long lists are still fetched as
+dicts, which orjson encodes faster (see benchmarks/bench_serialize.py).
+"""
+from dataclasses import dataclass
+from datetime import datetime
+
+
+@dataclass(frozen=True, slots=True)
+class Message:
+    id: int
+    message: str
+    created_at: datetime
+
+    COLUMNS = ["id", "message", "created_at"]
+
+
+@dataclass(frozen=True, slots=True)
+class TopMessage:
+    id: int
+    message: str
+    upvotes: int
+
+    COLUMNS = ["id", "message", "upvote_count"]
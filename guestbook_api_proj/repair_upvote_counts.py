@@ -0,0 +1,26 @@
+"""Recompute guestbook.upvote_count from the upvotes table.
+
+The counters are maintained by a trigger, so this is only needed after
+manual data fixes or to verify consistency:
+
+    python repair_upvote_counts.py
+"""
+from dotenv import load_dotenv
+from db import Database
+
+
+def main():
+    load_dotenv()
+    db = Database()
+    db.open()
+
+    try:
+        fixed = db.call("repair_upvote_counts")
+    finally:
+        db.close()
+
+    print(f"Repaired upvote counts on {fixed} message(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+from os import environ as env
+from threading import Lock
+from time import monotonic
+from cache import TTLCache
+
+
+class ReplicaRouter:
+    """Spreads reads over a set of replica pools.
+
+    Replicas are tried in round-robin order, or least busy first with the
+    "least_connections" strategy. A replica that cannot hand out a connection is
+    skipped for `retry_after` seconds; with none left, reads go to the primary.
+    Sessions that wrote within the last `read_your_writes` seconds are pinned to
+    the primary so they always see their own changes.
+
+    This is the bookkeeping only; async_db.AsyncReplicaRouter checks the
+    connections out of `pools`.
+    """
+
+    STRATEGIES = ("round_robin", "least_connections")
+
+    def __init__(self, pools: list, strategy: str = None, retry_after: float = None, read_your_writes: float = None):
+        self.pools = list(pools)
+        self.strategy = strategy or env.get("DB_REPLICA_STRATEGY", "round_robin")
+        self.retry_after = float(retry_after if retry_after is not None else env.get("DB_REPLICA_RETRY_AFTER", 5))
+
+        if self.strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown replica strategy {self.strategy!r}, expected one of {self.STRATEGIES}")
+
+        window = float(read_your_writes if read_your_writes is not None else env.get("DB_READ_YOUR_WRITES", 5))
+        self.recent_writers = TTLCache(maxsize=int(env.get("DB_READ_YOUR_WRITES_SIZE", 65536)) if window else 0,
+                                       ttl=window)
+
+        self.in_use = [0] * len(self.pools)
+        self.down_until = [0.0] * len(self.pools)
+        self._next = 0
+        self._lock = Lock()
+        self._stats = {
+            "checkouts": 0,
+            "pinned": 0,
+            "fallbacks": 0,
+            "failures": 0,
+        }
+
+    def candidates(self) -> list[int]:
+        now = monotonic()
+
+        with self._lock:
+            count = len(self.pools)
+            start, self._next = self._next, (self._next + 1) % count
+            # rotating first keeps least_connections from always favouring replica 0 on ties
+            order = [(start + offset) % count for offset in range(count)]
+            order = [index for index in order if self.down_until[index] <= now]
+
+            if self.strategy == "least_connections":
+                order.sort(key=self.in_use.__getitem__)
+
+            return order
+
+    def acquired(self, index: int):
+        with self._lock:
+            self.in_use[index] += 1
+            self._stats["checkouts"] += 1
+
+    def released(self, index: int):
+        with self._lock:
+            self.in_use[index] -= 1
+
+    def failed(self, index: int):
+        with self._lock:
+            self.down_until[index] = monotonic() + self.retry_after
+            self._stats["failures"] += 1
+
+    def fell_back(self):
+        with self._lock:
+            self._stats["fallbacks"] += 1
+
+    def record_write(self, session):
+        if session is not None:
+            self.recent_writers.set(session, True)
+
+    def is_pinned(self, session) -> bool:
+        if session is None or not self.recent_writers.get(session):
+            return False
+
+        with self._lock:
+            self._stats["pinned"] += 1
+        return True
+
+    def get_stats(self):
+        now = monotonic()
+
+        with self._lock:
+            stats = dict(self._stats)
+            stats["replicas"] = len(self.pools)
+            stats["in_use"] = list(self.in_use)
+            stats["down"] = [index for index, until in enumerate(self.down_until) if until > now]
+
+        stats["strategy"] = self.strategy
+        return stats
+
+
+def replica_urls() -> list[str]:
+    # DB_REPLICA_URLS: comma-separated connection URLs of read replicas
+    return [url.strip() for url in env.get("DB_REPLICA_URLS", "").split(",") if url.strip()]
@@ -0,0 +1,42 @@
+"""JSON responses that skip FastAPI's jsonable_encoder.
+
+A handler that returns a plain value has it walked by jsonable_encoder
+(dataclasses become dicts, datetimes strings) and then encoded again by
+json.dumps. Returning FastJSONResponse(content) encodes once, straight
+from records.* instances, dicts and datetimes. orjson is used when it is
+installed (pip install orjson) unless JSON_ENCODER=json; the stdlib
+fallback produces the same output, only slower.
+"""
+import json
+from dataclasses import fields, is_dataclass
+from datetime import date, datetime
+from os import environ as env
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+USE_ORJSON = orjson is not None and env.get("JSON_ENCODER", "orjson") != "json"
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if is_dataclass(value):
+        return {field.name: getattr(value, field.name) for field in fields(value)}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if USE_ORJSON:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
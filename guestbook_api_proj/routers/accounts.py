@@ -1,25 +1,42 @@
+from datetime import datetime, timedelta, timezone
+from os import environ as env
 from uuid import uuid4
 from fastapi import APIRouter, HTTPException, status, Query, Depends
-from pydantic import BaseModel, EmailStr, SecretStr, ValidationError
-from psycopg2.errors import UniqueViolation
-from db import Database
+from pydantic import BaseModel, SecretStr, ValidationError, field_validator
+from psycopg.errors import UniqueViolation
+from async_db import AsyncDatabase
 from dependencies import get_db
-from utils import get_password_hash
+from hashing import hash_pool
 
 router = APIRouter(tags=["accounts"])
 
+# how long an activation link stays valid; expired tokens are removed by purge.TokenPurger
+TOKEN_TTL = timedelta(seconds=float(env.get("TOKEN_TTL", 2 * 24 * 3600)))
+
 
 class User(BaseModel):
-    email: EmailStr
+    email: str
     password: SecretStr
 
+    # what EmailStr checks, with email_validator imported on the first registration instead of with the app
+    @field_validator("email")
+    @classmethod
+    def check_email(cls, email: str) -> str:
+        from email_validator import validate_email
+
+        validate_email(email, check_deliverability=False)  # EmailNotValidError is a ValueError
+        return email
+
 
 @router.post("/activate")
-def activate(token: str, db: Database = Depends(get_db)):
-    token = db.get_one("tokens", ["user_id"], where={"token": token})
+async def activate(token: str, db: AsyncDatabase = Depends(get_db, scope="function")):
+    token = await db.get_one("tokens", ["user_id", "expires_at"], where={"token": token})
+
+    if token and token.get("expires_at") <= datetime.now(timezone.utc):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="This activation link has expired")
 
     if token:
-        is_account_active = db.get_one("users", ["active"], where={"id": token.get("user_id")})
+        is_account_active = await db.get_one("users", ["active"], where={"id": token.get("user_id")})
 
         if is_account_active.get('active'):
             raise HTTPException(
@@ -27,22 +44,26 @@ def activate(token: str, db: Database = Depends(get_db)):
                 detail="Account already activated"
             )
 
-        db.update('users', ['active', 'activated_at'], ['true', 'now()'], where={"id": token.get('user_id')})
+        await db.update('users', ['active', 'activated_at'], ['true', 'now()'], where={"id": token.get('user_id')})
+        # one use only; committed together with the activation
+        await db.delete('tokens', where={"user_id": token.get('user_id')})
         return {"status": "Your account has been activated!"}
     else:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid token")
 
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-def register(email: str, password: SecretStr = Query(default=None, min_length=8), db: Database = Depends(get_db)):
+async def register(email: str, password: SecretStr = Query(default=None, min_length=8),
+                   db: AsyncDatabase = Depends(get_db, scope="function")):
     try:
         user = User(email=email, password=password)
-        hashed_password = get_password_hash(password.get_secret_value())
+        hashed_password = await hash_pool.hash(password.get_secret_value())
         token = str(uuid4())
 
-        user_id = db.write('users', ['email', 'password'], [email, hashed_password])
+        user_id = await db.write('users', ['email', 'password'], [email, hashed_password])
 
-        db.write('tokens', ['token', 'user_id'], [token, user_id])
+        await db.write('tokens', ['token', 'user_id', 'expires_at'],
+                       [token, user_id, datetime.now(timezone.utc) + TOKEN_TTL])
 
         return {"message": "User created", "user_id": user_id}
     except ValidationError:
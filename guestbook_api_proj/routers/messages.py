@@ -1,133 +1,332 @@
-from fastapi import APIRouter, Form, Depends, HTTPException, status
-from dependencies import get_db, validate_user
-from db import Database
+from csv import writer
+from dataclasses import replace
+from datetime import datetime
+from io import StringIO
+from json import dumps
+from os import environ as env
+from typing import Literal
+from fastapi import APIRouter, Form, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from psycopg import Error as DatabaseError
+from cache import CacheBackend
+from dependencies import authenticate, get_db, get_response_cache, open_db, validate_user
+from async_db import AsyncDatabase
+from ingest import NDJSON, PARSERS, read_messages
+from records import Message, TopMessage
+from responses import FastJSONResponse
+from utils import decode_cursor, encode_cursor
 
 router = APIRouter(tags=["messages"])
 
+# newest first; id breaks ties between messages created in the same instant
+PAGE_ORDER = ["created_at", "id"]
+SEARCH_ORDER = ["rank", "id"]
+
+BULK_BATCH_SIZE = int(env.get("BULK_BATCH_SIZE", 1000))
+BULK_MAX_REPORTED_ERRORS = 100
+
+# response cache keys; every write below names the ones it makes stale, deleted once it has committed
+# so a GET that starts afterwards reads the new row. A GET that read the old row just before the
+# commit can still store it after the delete: that entry is stale until RESPONSE_CACHE_TTL expires it
+MOST_UPVOTED_KEY = "messages:most_upvoted"
+
+
+def _message_key(message_id: int, owner: int = None):
+    # a public message is shared by every caller, a private one is cached for its owner only
+    return f"messages:{message_id}" if owner is None else f"messages:{message_id}:{owner}"
+
+
+EXPORT_BATCH_SIZE = int(env.get("EXPORT_BATCH_SIZE", 1000))
+EXPORT_COLUMNS = ["id", "message", "private", "created_at"]
+
+
+def _after(cursor: str, parse=(datetime.fromisoformat, int)):
+    if not cursor:
+        return None
+
+    try:
+        values = decode_cursor(cursor)
+        if len(values) != len(parse):
+            raise ValueError("Malformed cursor")
+
+        return [convert(value) for convert, value in zip(parse, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def _ndjson(rows):
+    return "".join(dumps(row, default=datetime.isoformat) + "\n" for row in rows)
+
+
+def _csv(rows):
+    buffer = StringIO()
+    writer(buffer).writerows([row[column] for column in EXPORT_COLUMNS] for row in rows)
+    return buffer.getvalue()
+
+
+def _page(messages: list, num: int, order=PAGE_ORDER):
+    # one extra row was fetched to tell whether another page exists
+    next_cursor = None
+
+    if len(messages) > num:
+        messages = messages[:num]
+        next_cursor = encode_cursor([messages[-1][key] for key in order])
+
+    return {"messages": messages, "next_cursor": next_cursor}
+
 
 @router.get("/messages/most_upvoted")
-def get_most_upvoted_messages(db: Database = Depends(get_db)):
-    messages = db.get("top_messages", ["id", "message", "upvotes"])
+async def get_most_upvoted_messages(request: Request, cache: CacheBackend = Depends(get_response_cache)):
+    messages = await cache.get(MOST_UPVOTED_KEY)
 
-    return messages
+    if messages is None:
+        # only a miss needs a connection
+        db = await open_db(request)
+        try:
+            messages = await db.get("guestbook", TopMessage.COLUMNS,
+                                    where={"private": False},
+                                    order_by=["upvote_count", "id"],
+                                    descending=True,
+                                    limit=10,
+                                    record=TopMessage)
+        finally:
+            await db.close()
 
+        await cache.set(MOST_UPVOTED_KEY, messages)
 
-@router.post("/messages/{message_id}/upvote")
-def upvote_a_specific_message(message_id: int, db: Database = Depends(get_db),
-                              user_id: str = Depends(validate_user)):
-    # 1. does the message even exist? try to get it from the db.
-    message = db.get_one("guestbook", ["id", "user_id", "private"], where={"id": message_id})
+    buffer = request.app.state.upvote_buffer
+    if buffer and buffer.per_message:
+        # upvotes accepted but not flushed yet
+        messages = [replace(m, upvotes=m.upvotes + buffer.pending_upvotes(m.id)) for m in messages]
+        messages.sort(key=lambda m: (m.upvotes, m.id), reverse=True)
+
+    return FastJSONResponse(messages)
 
-    # 2. prevent users from upvoting private messages they do not own, or messages that don't exist
-    if (not message) or (message['private'] and message['user_id'] != user_id):
+
+@router.post("/messages/{message_id}/upvote")
+async def upvote_a_specific_message(request: Request, message_id: int,
+                                    db: AsyncDatabase = Depends(get_db, scope="function"),
+                                    cache: CacheBackend = Depends(get_response_cache),
+                                    user_id: str = Depends(validate_user)):
+    buffer = request.app.state.upvote_buffer
+
+    if buffer:
+        # write-behind: checked now, inserted with the next flush, which also clears MOST_UPVOTED_KEY
+        result = await buffer.upvote(db, user_id, message_id)
+    else:
+        # visibility, ownership and duplicate checks happen inside upvote_message, in one statement
+        result = await db.call("upvote_message", [user_id, message_id])
+
+    if result == "not_found":
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="A message by this id either does not exist or is private")
 
-    # 3. prevent users from upvoting their own messages
-    if message["user_id"] == user_id:
+    if result == "own_message":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Please upvote messages other than your own")
 
-    # 4. prevent users from upvoting a messages more than once
-    upvote = db.get_one("upvotes", ["id"], where={"user_id": user_id, "message_id": message_id})
-
-    if upvote:
+    if result == "duplicate":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="You have already upvoted this message")
 
-    db.write("upvotes", ["user_id", "message_id"], [user_id, message_id])
+    if not buffer:
+        await db.after_commit(cache.delete, MOST_UPVOTED_KEY)
 
     return {"status": "Successfully upvoted message with id " + str(message_id) + ". Thank you!"}
 
 
 @router.post("/messages")
-def write_a_message_on_the_guestbook(message: str = Form(...), private: bool = Form(False),
-                                     db: Database = Depends(get_db),
-                                     user_id: int = Depends(validate_user)):
-    message_id = db.write("guestbook", ["user_id", "message", "private"], [user_id, message, private])
+async def write_a_message_on_the_guestbook(message: str = Form(...), private: bool = Form(False),
+                                           db: AsyncDatabase = Depends(get_db, scope="function"),
+                                           cache: CacheBackend = Depends(get_response_cache),
+                                           user_id: int = Depends(validate_user)):
+    message_id = await db.write("guestbook", ["user_id", "message", "private"], [user_id, message, private])
+    # a new message can enter the top ten while there are fewer than ten public messages
+    await db.after_commit(cache.delete, MOST_UPVOTED_KEY)
 
     return {
         "message_id": message_id
     }
 
 
+# body: NDJSON ({"message": ..., "private": ...} per line) or CSV with a message[,private] header.
+# not part of the request's unit of work: the upload gets its own connection and every batch
+# commits on its own, so one bad batch does not undo the others, a large load never holds one
+# long transaction (or thousands of savepoints), and each batch is committed once reported
+@router.post("/messages/bulk")
+async def write_many_messages_on_the_guestbook(request: Request,
+                                               cache: CacheBackend = Depends(get_response_cache),
+                                               user_id: int = Depends(authenticate)):
+    content_type = request.headers.get("content-type", NDJSON).split(";")[0].strip().lower()
+
+    if content_type not in PARSERS:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail=f"Send one of: {', '.join(PARSERS)}")
+
+    report = {"inserted": 0, "batches": [], "rejected_count": 0, "rejected": []}
+    db = await open_db(request, session=user_id)
+
+    async def flush(rows):
+        batch = {"batch": len(report["batches"]), "rows": len(rows)}
+
+        try:
+            # outside any transaction(), write_many's own is the outermost and commits the batch
+            batch["ids"] = await db.write_many("guestbook", ["user_id", "message", "private"],
+                                               [(user_id, message, private) for message, private in rows])
+            report["inserted"] += len(rows)
+        except DatabaseError as e:
+            batch["error"] = str(e).splitlines()[0]
+
+        report["batches"].append(batch)
+
+    try:
+        rows = []
+        async for number, row, error in read_messages(request.stream(), content_type):
+            if error:
+                report["rejected_count"] += 1
+                if len(report["rejected"]) < BULK_MAX_REPORTED_ERRORS:
+                    report["rejected"].append({"record": number, "error": error})
+                continue
+
+            rows.append(row)
+            if len(rows) == BULK_BATCH_SIZE:
+                await flush(rows)
+                rows = []
+
+        if rows:
+            await flush(rows)
+    finally:
+        await db.close()
+
+    if report["inserted"]:
+        await cache.delete(MOST_UPVOTED_KEY)
+
+    return report
+
+
 # POST  -> create a new resource
 # PUT   -> update an existing resource (full replace)
 # PATCH -> update an existing resource (partially)
 
 @router.patch("/messages/{message_id}")
-def update_a_specific_message(message_id: int, message: str = Form(...), private: bool = Form(False),
-                              db: Database = Depends(get_db),
-                              user_id: str = Depends(validate_user)):
-    message_db = db.get_one("guestbook", ["id", "user_id"], where={"id": message_id})
+async def update_a_specific_message(message_id: int, message: str = Form(...), private: bool = Form(False),
+                                    db: AsyncDatabase = Depends(get_db, scope="function"),
+                                    cache: CacheBackend = Depends(get_response_cache),
+                                    user_id: str = Depends(validate_user)):
+    message_db = await db.get_one("guestbook", ["id", "user_id"], where={"id": message_id})
 
     if not message_db:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message was not found")
 
     if message_db.get("user_id") == user_id:
-        db.update("guestbook", ["message", "private"], [message, private], where={"id": message_id})
+        await db.update("guestbook", ["message", "private"], [message, private], where={"id": message_id})
+        await db.after_commit(cache.delete, _message_key(message_id), _message_key(message_id, user_id),
+                              MOST_UPVOTED_KEY)
         return {"status": "Message updated"}
 
     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not allowed to update this message")
 
 
 @router.get("/messages/search")
-def search_for_messages_by_keyword(search_term: str, num: int = 10,
-                                   db: Database = Depends(get_db),
-                                   user_id: int = Depends(validate_user)):
-    # all public messages + all private messages that contain search_term
-    messages = db.get("guestbook",
-                      ["id", "message", "private"],
-                      where={"private": False},
-                      or_where={"private": True, "user_id": user_id},
-                      contains={"message": search_term},
-                      limit=num)
-
-    return messages
+async def search_for_messages_by_keyword(search_term: str, num: int = Query(10, ge=1), cursor: str = None,
+                                         db: AsyncDatabase = Depends(get_db, scope="function"),
+                                         user_id: int = Depends(validate_user)):
+    # all public messages + all private messages matching search_term, best match first.
+    # search_term takes web-search syntax: words, "quoted phrases", OR and -excluded
+    messages = await db.search("guestbook",
+                               ["id", "message", "private", "created_at"],
+                               search_term,
+                               where={"private": False},
+                               or_where={"private": True, "user_id": user_id},
+                               after=_after(cursor, parse=(float, int)),
+                               limit=num + 1)
+
+    return FastJSONResponse(_page(messages, num, order=SEARCH_ORDER))
+
+
+@router.get("/messages/export")
+async def export_messages(request: Request, format: Literal["ndjson", "csv"] = "ndjson",
+                          user_id: int = Depends(authenticate)):
+    async def body():
+        # checked out only once the response is being sent, and returned when the generator
+        # finishes: a generator that never starts (the client left first) holds nothing.
+        # authenticate has already returned its own, so this is the only connection held
+        db = await open_db(request, session=user_id)
+        try:
+            if format == "csv":
+                yield _csv([dict(zip(EXPORT_COLUMNS, EXPORT_COLUMNS))])
+
+            async for rows in db.stream("guestbook", EXPORT_COLUMNS,
+                                        batch_size=EXPORT_BATCH_SIZE,
+                                        where={"private": False},
+                                        or_where={"private": True, "user_id": user_id},
+                                        order_by=PAGE_ORDER):
+                yield _csv(rows) if format == "csv" else _ndjson(rows)
+        finally:
+            await db.close()
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="messages.{format}"'})
 
 
 @router.get("/messages/{message_id}")
-def get_a_specific_message(message_id: int, db: Database = Depends(get_db),
-                           user_id: int = Depends(validate_user)):
-    message = db.get_one(
-        table="guestbook",
-        columns=["id", "user_id", "message", "private", "created_at"],
-        where={"id": message_id}
-    )
-
-    if (not message) or (message['private'] and message['user_id'] != user_id):
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail="A public message by that id could not be found")
+async def get_a_specific_message(message_id: int,
+                                 db: AsyncDatabase = Depends(get_db, scope="function"),
+                                 cache: CacheBackend = Depends(get_response_cache),
+                                 user_id: int = Depends(validate_user)):
+    message = await cache.get(_message_key(message_id)) or await cache.get(_message_key(message_id, user_id))
 
-    # do not return user_id and private
-    exclude = ["user_id", "private"]
+    if message is None:
+        # visibility is decided in SQL: the row comes back only if it is public or the caller's own
+        row = await db.get_one("guestbook", Message.COLUMNS + ["private"],
+                               where={"id": message_id, "private": False},
+                               or_where={"id": message_id, "private": True, "user_id": user_id},
+                               record=tuple)
 
-    return {k: v for k, v in message.items() if k not in exclude}
+        if not row:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail="A public message by that id could not be found")
 
+        *values, private = row
+        message = Message(*values)
+        await cache.set(_message_key(message_id, user_id if private else None), message)
 
-@router.get("/messages")
-def get_all_messages(num: int = 10, db: Database = Depends(get_db), user_id: str = Depends(validate_user)):
-    messages = db.get(table="guestbook",
-                      columns=["id", "message", "created_at"],
-                      where={"private": False},
-                      or_where={"private": True, "user_id": user_id},
-                      limit=num)
+    return FastJSONResponse(message)
 
-    return messages
+
+@router.get("/messages")
+async def get_all_messages(num: int = Query(10, ge=1), cursor: str = None,
+                           db: AsyncDatabase = Depends(get_db, scope="function"),
+                           user_id: str = Depends(validate_user)):
+    messages = await db.get(table="guestbook",
+                            columns=["id", "message", "created_at"],
+                            where={"private": False},
+                            or_where={"private": True, "user_id": user_id},
+                            order_by=PAGE_ORDER,
+                            descending=True,
+                            after=_after(cursor),
+                            limit=num + 1)
+
+    # plain dict rows: with orjson they encode faster than records (benchmarks/bench_serialize.py)
+    return FastJSONResponse(_page(messages, num))
 
 
 @router.delete("/messages/{message_id}")
-def delete_a_specific_message(message_id: int,
-                              db: Database = Depends(get_db),
-                              user_id: str = Depends(validate_user)):
-    message = db.get_one("guestbook", ["id", "user_id"], where={"id": message_id})
+async def delete_a_specific_message(message_id: int,
+                                    db: AsyncDatabase = Depends(get_db, scope="function"),
+                                    cache: CacheBackend = Depends(get_response_cache),
+                                    user_id: str = Depends(validate_user)):
+    message = await db.get_one("guestbook", ["id", "user_id"], where={"id": message_id})
 
     if not message:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Message was not found")
 
     if message.get("user_id") == user_id:
-        db.delete("guestbook", where={"id": message_id})
+        await db.delete("guestbook", where={"id": message_id})
+        await db.after_commit(cache.delete, _message_key(message_id), _message_key(message_id, user_id),
+                              MOST_UPVOTED_KEY)
         return {"status": "Message deleted"}
 
     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
@@ -0,0 +1,192 @@
+"""Slow-query log, and a report over it.
+
+Database and AsyncDatabase hand every statement that took at least
+SLOW_QUERY_MS (default 200) to slow_queries.record(). Each one is written
+as a JSON line to SLOW_QUERY_LOG (default slow_queries.log; empty turns the
+log off), rotated at SLOW_QUERY_LOG_BYTES and kept SLOW_QUERY_LOG_BACKUPS
+times. A line holds the statement shape, its parameters with the values
+redacted, the duration and the row count.
+
+For slow reads (get, get_one, get_contains, search) the statement is also
+run again under EXPLAIN (ANALYZE, BUFFERS) and the plan is stored with it.
+That doubles the cost of the query it samples, so it happens for a fraction
+SLOW_QUERY_EXPLAIN_RATE of them (default 0.1) and at most once per shape
+every SLOW_QUERY_EXPLAIN_INTERVAL seconds (default 300). Only SELECTs are
+ever explained; writes and function calls are logged without a plan.
+
+    python slowlog.py                 # top 20 shapes by total time
+    python slowlog.py --by p95 --top 5 --plans
+"""
+import argparse
+import json
+import logging
+import random
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from os import environ as env
+from pathlib import Path
+from statistics import quantiles
+from threading import Lock
+from time import monotonic
+
+EXPLAIN = "EXPLAIN (ANALYZE, BUFFERS) "
+
+log = logging.getLogger("guestbook.slow_queries")
+
+
+def redact(value):
+    """What a parameter was, never what it said: None and booleans are kept, sizes of text and lists."""
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, (str, bytes)):
+        return f"<{type(value).__name__}:{len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float = None, path: str = None, explain_rate: float = None,
+                 explain_interval: float = None, max_bytes: int = None, backups: int = None):
+        self.threshold = float(threshold_ms if threshold_ms is not None else env.get("SLOW_QUERY_MS", 200)) / 1000
+        self.path = path if path is not None else env.get("SLOW_QUERY_LOG", "slow_queries.log")
+        self.explain_rate = float(explain_rate if explain_rate is not None
+                                  else env.get("SLOW_QUERY_EXPLAIN_RATE", 0.1))
+        self.explain_interval = float(explain_interval if explain_interval is not None
+                                      else env.get("SLOW_QUERY_EXPLAIN_INTERVAL", 300))
+        self.max_bytes = int(max_bytes if max_bytes is not None else env.get("SLOW_QUERY_LOG_BYTES", 10_000_000))
+        self.backups = int(backups if backups is not None else env.get("SLOW_QUERY_LOG_BACKUPS", 5))
+        self.logged = 0
+        self.explained = 0
+        self._explained_at = {}  # shape -> monotonic time of its last EXPLAIN
+        self._handler = None
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def is_slow(self, duration: float) -> bool:
+        return self.enabled and duration >= self.threshold
+
+    def should_explain(self, shape: str) -> bool:
+        if not shape.lstrip().upper().startswith("SELECT") or random.random() >= self.explain_rate:
+            return False
+
+        now = monotonic()
+        with self._lock:
+            if now - self._explained_at.get(shape, -self.explain_interval) < self.explain_interval:
+                return False
+            self._explained_at[shape] = now
+
+        return True
+
+    def _open(self):
+        # the file is created with the first slow query, not at import
+        with self._lock:
+            if self._handler is None:
+                self._handler = RotatingFileHandler(self.path, maxBytes=self.max_bytes,
+                                                    backupCount=self.backups, encoding="utf-8")
+                log.addHandler(self._handler)
+                log.setLevel(logging.INFO)
+                log.propagate = False
+
+    def record(self, shape: str, params, duration: float, rows: int, plan: str = None):
+        self._open()
+
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "ms": round(duration * 1000, 2),
+            "rows": rows,
+            "shape": shape,
+            "params": redact(list(params or ())),
+        }
+        if plan is not None:
+            entry["plan"] = plan
+            self.explained += 1
+
+        self.logged += 1
+        log.info(json.dumps(entry))
+
+    def get_stats(self):
+        return {"threshold_ms": self.threshold * 1000, "logged": self.logged, "explained": self.explained}
+
+
+slow_queries = SlowQueryLog()
+
+
+def read_entries(paths):
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by rotation or a crash
+
+
+def summarize(entries):
+    shapes = {}
+
+    for entry in entries:
+        shape = shapes.setdefault(entry["shape"], {"durations": [], "rows": 0, "last": None, "plan": None})
+        shape["durations"].append(entry["ms"])
+        shape["rows"] += entry["rows"] if entry["rows"] and entry["rows"] > 0 else 0
+        shape["last"] = max(shape["last"] or entry["at"], entry["at"])
+        if "plan" in entry:
+            shape["plan"] = entry["plan"]
+
+    report = []
+    for text, shape in shapes.items():
+        durations = sorted(shape["durations"])
+        count = len(durations)
+        report.append({
+            "shape": text,
+            "count": count,
+            "total": sum(durations),
+            "mean": sum(durations) / count,
+            "p95": quantiles(durations, n=20)[-1] if count > 1 else durations[0],
+            "max": durations[-1],
+            "rows": shape["rows"] / count,
+            "last": shape["last"],
+            "plan": shape["plan"],
+        })
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="log files (default: SLOW_QUERY_LOG and its backups)")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--by", choices=["total", "count", "mean", "p95", "max"], default="total")
+    parser.add_argument("--plans", action="store_true", help="print the latest captured plan of each shape")
+    args = parser.parse_args()
+
+    # the API loads .env in main.create_app(); read it here too, for SLOW_QUERY_LOG and its backups
+    from dotenv import load_dotenv
+    load_dotenv()
+    settings = SlowQueryLog()
+
+    paths = args.paths
+    if not paths:
+        current = Path(settings.path or "slow_queries.log")
+        paths = [p for p in [current, *(Path(f"{current}.{i}") for i in range(1, settings.backups + 1))]
+                 if p.exists()]
+        if not paths:
+            raise SystemExit(f"{current} does not exist yet")
+
+    report = sorted(summarize(read_entries(paths)), key=lambda shape: -shape[args.by])[:args.top]
+
+    for rank, shape in enumerate(report, 1):
+        print(f"#{rank}  {shape['count']} x  total {shape['total']:.0f}ms  mean {shape['mean']:.1f}ms  "
+              f"p95 {shape['p95']:.1f}ms  max {shape['max']:.1f}ms  rows {shape['rows']:.0f}  "
+              f"last {shape['last']}")
+        print(f"    {shape['shape']}")
+        if args.plans:
+            print("\n".join("    | " + line for line in (shape["plan"] or "(no plan captured)").splitlines()))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the application modules are imported top-level, as main.py and the scripts do
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
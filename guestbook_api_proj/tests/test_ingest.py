@@ -0,0 +1,70 @@
+"""The bulk upload parsers; no database needed."""
+import asyncio
+import pytest
+from ingest import CSV, NDJSON, read_messages
+
+
+def parse(body: bytes, content_type: str, chunk_size: int = 7):
+    async def stream():
+        # small chunks, so records and multi-byte characters are split across reads
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+
+    async def collect():
+        return [record async for record in read_messages(stream(), content_type)]
+
+    return asyncio.run(collect())
+
+
+def test_ndjson():
+    body = b'{"message": "hello"}\n\n{"message": "caf\xc3\xa9", "private": true}\r\n{"message": ""}\n'
+    assert parse(body, NDJSON) == [
+        (1, ("hello", False), None),
+        (2, ("café", True), None),
+        (3, None, "message must be a non-empty string"),
+    ]
+
+
+@pytest.mark.parametrize("line", [b"not json", b"[1, 2]", b'{"message": "x", "private": "maybe"}',
+                                  b'{"message": "bad \xff"}'])
+def test_ndjson_rejects_one_record(line):
+    records = parse(b'{"message": "a"}\n' + line + b'\n{"message": "b"}', NDJSON)
+
+    assert [number for number, _, _ in records] == [1, 2, 3]
+    assert records[1][1] is None and records[1][2]
+    assert records[2] == (3, ("b", False), None)
+
+
+def test_csv():
+    body = b'Message,Private\nhello,yes\n"two\nlines, and a ""quote""",0\n\ncaf\xc3\xa9,\n'
+    assert parse(body, CSV) == [
+        (1, ("hello", True), None),
+        (2, ('two\nlines, and a "quote"', False), None),
+        (3, ("café", False), None),
+    ]
+
+
+def test_csv_rejects_one_record():
+    records = parse(b'message,private\n"bad \xff\nstill bad",1\nok,maybe\nfine,1\n', CSV)
+
+    assert records[0][:2] == (1, None) and "utf-8" in records[0][2]
+    assert records[1] == (2, None, "private must be a boolean, got 'maybe'")
+    assert records[2] == (3, ("fine", True), None)
+
+
+def test_csv_unterminated_quote():
+    records = parse(b'message\nok\n"bad\nmore\nrows', CSV)
+
+    assert records[0] == (1, ("ok", False), None)
+    assert records[1][:2] == (2, None) and "unterminated" in records[1][2]
+    assert len(records) == 2
+
+
+@pytest.mark.parametrize("body", [b"", b"\n\n\r\n", b'"message\nok\n', b"text,private\nhello,1\n",
+                                  b"mess\xffage\nhello\n"])
+def test_csv_without_a_usable_header(body):
+    records = parse(body, CSV)
+
+    assert len(records) == 1
+    number, message, error = records[0]
+    assert number == 0 and message is None and error
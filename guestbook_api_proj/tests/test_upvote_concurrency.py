@@ -0,0 +1,51 @@
+"""benchmarks/hammer_upvote.py as a test, on a user and message created for it.
+
+Needs a migrated database: skipped unless CONNECTION_URL is set (.env is read).
+"""
+import asyncio
+from os import environ as env
+from uuid import uuid4
+import pytest
+from dotenv import load_dotenv
+from psycopg import AsyncConnection
+from benchmarks.hammer_upvote import double_counted, hammer
+
+load_dotenv()
+
+pytestmark = pytest.mark.skipif(not env.get("CONNECTION_URL"), reason="needs CONNECTION_URL")
+
+CONCURRENCY = 50
+
+
+async def _setup(url):
+    async with await AsyncConnection.connect(url, autocommit=True) as conn:
+        voter, author = [(await (await conn.execute(
+            "INSERT INTO users (email, password, active) VALUES (%s, 'x', true) RETURNING id",
+            (f"test-upvote-{uuid4().hex}@example.com",))).fetchone())[0] for _ in range(2)]
+        message = (await (await conn.execute(
+            "INSERT INTO guestbook (user_id, message) VALUES (%s, 'hammered') RETURNING id",
+            (author,))).fetchone())[0]
+    return voter, author, message
+
+
+async def _teardown(url, users):
+    # cascades to the message and its upvotes
+    async with await AsyncConnection.connect(url, autocommit=True) as conn:
+        await conn.execute("DELETE FROM users WHERE id = ANY(%s)", (list(users),))
+
+
+def test_concurrent_upvotes_count_once():
+    url = env["CONNECTION_URL"]
+
+    async def run():
+        voter, author, message = await _setup(url)
+        try:
+            return await hammer(url, voter, message, CONCURRENCY)
+        finally:
+            await _teardown(url, (voter, author))
+
+    results, before, after, _ = asyncio.run(run())
+
+    assert not double_counted(results, before, after)
+    assert results == {"upvoted": 1, "duplicate": CONCURRENCY - 1}
+    assert after == before + 1
@@ -0,0 +1,187 @@
+"""Write-behind buffering of upvotes (UPVOTE_WRITE_BEHIND=1).
+
+Accepted upvotes go into an in-memory set, deduplicated per (voter,
+message). The set is flushed with one add_upvotes() call, a single
+multi-row insert that bumps each message's counter once. A flush happens
+when UPVOTE_FLUSH_SIZE upvotes are pending, every UPVOTE_FLUSH_INTERVAL
+seconds, and on shutdown. A crash can lose at most one interval's worth of
+upvotes.
+
+The checks upvote_message() does in one statement happen here as two reads
+(which can go to a replica). The insert skips whatever became invalid in
+between, and duplicates from other workers, so counts stay exact. With
+more than UPVOTE_BUFFER_MAX pending, e.g. while the database is
+unreachable, upvotes fall back to the write-through path.
+
+A flush that cannot reach the database keeps its batch for the next one. A
+batch the database rejects is written again pair by pair, and the pairs
+that still fail are dropped and logged rather than retried forever.
+"""
+import asyncio
+import logging
+from collections import Counter
+from os import environ as env
+from time import perf_counter
+from psycopg import Error as DatabaseError, OperationalError
+from async_db import AsyncDatabase
+from cache import CacheBackend
+import metrics
+
+log = logging.getLogger("guestbook.upvotes")
+
+buffered = metrics.register(metrics.Counter(
+    "guestbook_upvotes_buffered_total", "Upvotes accepted into the write-behind buffer."))
+flushed = metrics.register(metrics.Counter(
+    "guestbook_upvotes_flushed_total", "Buffered upvotes written, by outcome.", ["outcome"]))
+flush_duration = metrics.register(metrics.Histogram(
+    "guestbook_upvote_flush_seconds", "Time one write-behind flush took, including its commit."))
+
+
+def write_behind_enabled() -> bool:
+    return env.get("UPVOTE_WRITE_BEHIND", "0") == "1"
+
+
+class UpvoteBuffer:
+    def __init__(self, pool=None, cache: CacheBackend = None, invalidate: tuple = (), flush_size: int = None,
+                 interval: float = None, max_pending: int = None):
+        self.pool = pool
+        self.cache = cache
+        self.invalidate = invalidate  # cache keys made stale by a flush
+        self.flush_size = int(flush_size if flush_size is not None else env.get("UPVOTE_FLUSH_SIZE", 500))
+        self.interval = float(interval if interval is not None else env.get("UPVOTE_FLUSH_INTERVAL", 1))
+        self.max_pending = int(max_pending if max_pending is not None else env.get("UPVOTE_BUFFER_MAX", 50_000))
+        self.pending = {}  # (voter, message) -> None, an insertion-ordered set
+        self.per_message = Counter()
+        self._flushing = asyncio.Lock()
+        self._task = None
+        self._early_flushes = set()  # references keep the size-triggered flush tasks alive
+
+    def pending_upvotes(self, message_id: int) -> int:
+        return self.per_message[message_id]
+
+    async def upvote(self, db: AsyncDatabase, voter: int, target: int) -> str:
+        """Same result codes as the upvote_message() SQL function."""
+        if (voter, target) in self.pending:
+            return "duplicate"
+
+        if len(self.pending) >= self.max_pending:
+            result = await db.call("upvote_message", [voter, target])
+            if result == "upvoted" and self.cache is not None:
+                await db.after_commit(self.cache.delete, *self.invalidate)
+            return result
+
+        message = await db.get_one("guestbook", ["user_id", "private"], where={"id": target})
+
+        if not message or (message["private"] and message["user_id"] != voter):
+            return "not_found"
+
+        if message["user_id"] == voter:
+            return "own_message"
+
+        if await db.get_one("upvotes", ["id"], where={"user_id": voter, "message_id": target}):
+            return "duplicate"
+
+        # checked again: another request may have buffered the same pair while we awaited the reads
+        if (voter, target) in self.pending:
+            return "duplicate"
+
+        self.pending[(voter, target)] = None
+        self.per_message[target] += 1
+        buffered.inc()
+
+        if len(self.pending) >= self.flush_size and not self._flushing.locked():
+            task = asyncio.create_task(self.flush())
+            self._early_flushes.add(task)
+            task.add_done_callback(self._early_flushes.discard)
+
+        return "upvoted"
+
+    async def flush(self) -> int:
+        async with self._flushing:
+            if not self.pending:
+                return 0
+
+            batch, self.pending = self.pending, {}
+
+            start = perf_counter()
+            db = AsyncDatabase(pool=self.pool)
+            try:
+                added, dropped, retry = await self._write(db, list(batch))
+            finally:
+                await db.close()
+
+            if retry:
+                # kept for the next attempt; pairs accepted meanwhile are merged back in
+                flushed.inc("failed", amount=len(retry))
+                kept = dict.fromkeys(retry)
+                kept.update(self.pending)
+                self.pending = kept
+
+                if len(retry) == len(batch):
+                    return 0
+
+            # pending counts stay visible until the rows are committed, so most_upvoted never dips
+            retry = set(retry)
+            self.per_message.subtract(target for voter, target in batch if (voter, target) not in retry)
+            self.per_message = +self.per_message
+
+            flush_duration.observe(perf_counter() - start)
+            flushed.inc("inserted", amount=added)
+            flushed.inc("skipped", amount=len(batch) - len(retry) - dropped - added)
+
+            if self.cache is not None and added:
+                await self.cache.delete(*self.invalidate)
+
+            return added
+
+    async def _write(self, db: AsyncDatabase, pairs: list) -> tuple[int, int, list]:
+        """Insert pairs; returns how many were inserted, how many dropped, and the ones to retry."""
+        try:
+            await db.open()
+            async with db.transaction():
+                return await db.call("add_upvotes", [list(column) for column in zip(*pairs)]), 0, []
+        except OperationalError:
+            log.exception("flushing %d buffered upvote(s) failed, will retry", len(pairs))
+            return 0, 0, pairs
+        except DatabaseError:
+            # the same batch would fail again on every flush: find the pairs at fault
+            log.exception("flushing %d buffered upvote(s) failed, writing them one by one", len(pairs))
+
+        added = dropped = 0
+        for position, (voter, target) in enumerate(pairs):
+            try:
+                async with db.transaction():
+                    added += await db.call("add_upvotes", [[voter], [target]])
+            except OperationalError:
+                log.exception("flushing buffered upvotes failed, will retry the last %d", len(pairs) - position)
+                return added, dropped, pairs[position:]
+            except DatabaseError:
+                dropped += 1
+                flushed.inc("dropped")
+                log.exception("dropped the buffered upvote of message %s by user %s", target, voter)
+
+        return added, dropped, []
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="upvote-flush")
+
+    async def stop(self):
+        if self._task is not None:
+            # never mid-flush: its batch is already out of pending, and the cancelled
+            # transaction would roll it back
+            async with self._flushing:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # whatever is still buffered is written before the process exits
+        await self.flush()
@@ -1,11 +1,53 @@
-from passlib.context import CryptContext
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import lru_cache
+from hashlib import blake2b
+from json import dumps, loads
+from os import environ as env
+from secrets import token_bytes
 
-pwd_context = CryptContext(schemes=['bcrypt'])
+# per-process key, so cached digests are useless outside this worker
+_credential_key = token_bytes(32)
+
+
+@lru_cache(maxsize=None)
+def pwd_context():
+    # built on first use: with HASH_WORKERS > 0 only the hashing processes ever load passlib
+    from passlib.context import CryptContext
+
+    # cost factor for new hashes; lower it in dev/test, existing hashes keep their own
+    return CryptContext(schemes=['bcrypt'], bcrypt__rounds=int(env.get("BCRYPT_ROUNDS", 12)))
 
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
 
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return pwd_context().verify(plain_password, hashed_password)
+
+
+def credential_digest(email, hashed_password, plain_password):
+    # the stored hash is part of the digest, so a password change never matches an old entry
+    digest = blake2b(key=_credential_key, digest_size=32)
+
+    for part in (email, hashed_password, plain_password):
+        digest.update(part.encode())
+        digest.update(b"\0")
+
+    return digest.digest()
+
+
+def encode_cursor(values: list) -> str:
+    # opaque to clients; datetimes travel as ISO strings
+    payload = dumps(values, default=lambda v: v.isoformat(), separators=(",", ":"))
+    return urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """Raises ValueError for anything encode_cursor did not produce."""
+    payload = loads(urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+
+    if not isinstance(payload, list):
+        raise ValueError("Malformed cursor")
+
+    return payload